@@ -8,10 +8,13 @@
 
 
 #### Download data ####
+import os
+
 import polars as pl
 
-# URL of the CSV file
-url = "https://ckan0.cf.opendata.inter.prod-toronto.ca/dataset/hate-crimes-open-data/resource/5e89f848-1573-4306-b011-de35e18b50d8/download/Hate%20Crimes%20Open%20Data.csv"
+# URL of the CSV file (set CKAN_BASE_URL to download from another CKAN instance)
+base_url = os.environ.get("CKAN_BASE_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca").rstrip("/")
+url = base_url + "/dataset/hate-crimes-open-data/resource/5e89f848-1573-4306-b011-de35e18b50d8/download/Hate%20Crimes%20Open%20Data.csv"
 
 # Read the CSV file into a Polars DataFrame
 df = pl.read_csv(url)
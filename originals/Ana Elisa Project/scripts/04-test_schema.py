@@ -0,0 +1,62 @@
+#### Preamble ####
+# Purpose: Checks that the Polars rules (validate) and the pydantic model (validate_with_pydantic) agree
+# Author: Ana Elisa Lopez-Miranda
+# Date: 22 May 2025
+# Contact: a.lopez.miranda@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - Add `polars` and `pydantic`: uv add polars pydantic
+
+
+
+#### Workspace setup ####
+import polars as pl
+
+from hate_crimes_schema import validate, validate_with_pydantic
+
+
+#### Crafted rows ####
+# One valid row, then copies of it with a single value changed. The two paths word their error
+# messages differently, so they are compared on the valid rows and the failing (row, column) pairs.
+valid_row = {
+    "occurrence_date": "2020-01-05",
+    "reported_date": "2020-01-06",
+    "division": "D11",
+    "location_type": "Residence",
+    "primary_offence": "Assault",
+    "neighbourhood": "High Park North",
+    "arrest": "No",
+}
+changes = [
+    {},
+    {"occurrence_date": "2020-1-5"},  # not zero-padded
+    {"occurrence_date": " 2020-01-05"},  # leading space
+    {"reported_date": "2020-01-05 "},  # trailing space
+    {"reported_date": "2020/01/05"},
+    {"occurrence_date": "20200105"},
+    {"occurrence_date": "2020-02-30"},  # no such day
+    {"reported_date": "0001-01-01"},
+    {"reported_date": None},
+    {"division": "NA"},
+    {"primary_offence": "This should be removed"},
+    {"neighbourhood": "NSA"},
+    {"neighbourhood": "NSA (Not Specified Area)"},
+    {"arrest": None},
+]
+df = pl.DataFrame([{**valid_row, **change} for change in changes])
+
+
+#### Compare both paths ####
+fast_valid, fast_errors = validate(df)
+slow_valid, slow_errors = validate_with_pydantic(df)
+
+assert fast_valid.equals(slow_valid), "The two paths keep different rows"
+assert fast_errors.select("row", "column").equals(slow_errors.select("row", "column")), (
+    "The two paths flag different (row, column) pairs"
+)
+# A missing column is reported on every row
+fast_missing = validate(df.drop("arrest"))[1]
+slow_missing = validate_with_pydantic(df.drop("arrest"))[1]
+assert fast_missing.select("row", "column").equals(slow_missing.select("row", "column"))
+
+print(f"validate() and validate_with_pydantic() agree on {df.height} crafted rows")
@@ -0,0 +1,76 @@
+#### Preamble ####
+# Purpose: Serves the saved hate crimes data at its Toronto Open Data URL so the download can run offline
+# Author: Ana Elisa Lopez-Miranda
+# Date: 22 May 2025
+# Contact: a.lopez.miranda@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - Nothing to install (standard library only)
+# - Run "python scripts/ckan_fixture_server.py [--port 8000] [--data-dir data]" from the project folder, then
+#   "CKAN_BASE_URL=http://127.0.0.1:8000 python scripts/02-download_clean_data.py" in another terminal
+# - Serves only what 02-download_clean_data.py uses: the CSV resource's download URL, answered with
+#   HateCrimesOpenData.csv from the data folder
+# - https://docs.python.org/3/library/http.server.html
+
+
+
+#### Workspace setup ####
+import argparse
+import hashlib
+import json
+import shutil
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+RESOURCE_PATH = (
+    "/dataset/hate-crimes-open-data/resource/5e89f848-1573-4306-b011-de35e18b50d8/download/Hate Crimes Open Data.csv"
+)
+
+parser = argparse.ArgumentParser(description="Offline CKAN stand-in server.")
+parser.add_argument("--port", type=int, default=8000)
+parser.add_argument("--data-dir", type=Path, default=Path("data"))
+args = parser.parse_args()
+csv_path = args.data_dir / "HateCrimesOpenData.csv"
+
+
+#### Request handler ####
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if unquote(urlparse(self.path).path) == RESOURCE_PATH:
+            self.send_csv()
+        else:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+
+    # Streams the CSV, with an ETag / Last-Modified so conditional requests get "304 Not Modified"
+    def send_csv(self):
+        stat = csv_path.stat()
+        etag = '"' + hashlib.sha256(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.end_headers()
+        with open(csv_path, "rb") as csv_file:
+            shutil.copyfileobj(csv_file, self.wfile)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+#### Serve ####
+server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+print(f"Serving {csv_path} on http://127.0.0.1:{server.server_port}")
+server.serve_forever()
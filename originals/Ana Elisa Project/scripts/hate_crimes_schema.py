@@ -0,0 +1,137 @@
+#### Preamble ####
+# Purpose: Validation rules for the hate crimes datasets, checked as Polars expressions over whole columns
+# Author: Ana Elisa Lopez-Miranda
+# Date: 22 May 2025
+# Contact: a.lopez.miranda@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - Add `polars`: uv add polars
+# - Add `pydantic` (only for the slow path, validate_with_pydantic): uv add pydantic
+
+
+
+#### Workspace setup ####
+import polars as pl
+
+
+#### Schema ####
+# Each column: its type ("date" = yyyy-mm-dd, "string") and the values that are not allowed.
+# Every column is required and may not be missing (null).
+SCHEMA = {
+    "occurrence_date": {"type": "date"},
+    "reported_date": {"type": "date"},
+    "division": {"type": "string", "not_allowed": ["NA"]},
+    "location_type": {"type": "string", "not_allowed": ["NA"]},
+    "primary_offence": {"type": "string", "not_allowed": ["NA", "This should be removed"]},
+    "neighbourhood": {"type": "string", "not_allowed": ["NSA"]},
+    "arrest": {"type": "string"},  # should be yes or no
+}
+
+
+#### Rules as Polars expressions ####
+# For each column: an expression giving the error message of every row (null = the row is fine).
+def error_expression(df, column, rule):
+    if column not in df.columns:
+        return pl.lit("Field required")
+    value = pl.col(column)
+    if rule["type"] == "date":
+        text = value.cast(pl.String)
+        # to_date alone also accepts e.g. "2020-1-5" and " 2020-01-05"; the pattern keeps it to yyyy-mm-dd
+        parsed = text.str.to_date("%Y-%m-%d", strict=False)
+        wrong_type = value.is_not_null() & (~text.str.contains(r"^\d{4}-\d{2}-\d{2}$") | parsed.is_null())
+        type_message = "Input should be a valid date (yyyy-mm-dd)"
+    elif df.schema[column] != pl.String:
+        wrong_type = value.is_not_null()  # e.g. a column read as numbers
+        type_message = "Input should be a valid string"
+    else:
+        wrong_type = pl.lit(False)
+        type_message = None
+    not_allowed = rule.get("not_allowed", [])
+    return (
+        pl.when(value.is_null())
+        .then(pl.lit("Input should not be missing"))
+        .when(wrong_type)
+        .then(pl.lit(type_message))
+        .when(value.cast(pl.String).is_in(not_allowed))
+        .then(pl.format('"{}" is not an allowed value for ' + column, value.cast(pl.String)))
+    )
+
+
+# A column as its schema type (an all-null column if it is missing)
+def typed_column(df, column, rule):
+    dtype = pl.Date if rule["type"] == "date" else pl.String
+    if column not in df.columns:
+        return pl.lit(None, dtype=dtype).alias(column)
+    if rule["type"] == "date":
+        return pl.col(column).cast(pl.String).str.to_date("%Y-%m-%d", strict=False)
+    return pl.col(column).cast(pl.String)
+
+
+#### Validate a whole DataFrame in one pass ####
+# Returns the valid rows (schema columns only, dates as pl.Date) and a table of errors: one row per failing
+# (row, column), with the row's index in `df`.
+def validate(df):
+    errors = (
+        df.with_row_index("row")
+        .select(
+            "row",
+            *[
+                error_expression(df, column, rule).alias(column)
+                for column, rule in SCHEMA.items()
+            ],
+        )
+        .unpivot(index="row", variable_name="column", value_name="error")
+        .drop_nulls("error")
+        .sort("row", maintain_order=True)  # errors of a row in schema order
+    )
+    valid = (
+        df.with_row_index("row")
+        .filter(~pl.col("row").is_in(errors["row"].implode()))
+        .select([typed_column(df, column, rule) for column, rule in SCHEMA.items()])
+    )
+    return valid, errors
+
+
+#### Slow path: the same rules as a pydantic model, checked row by row ####
+# Kept for cross-checking validate(); needs pydantic. Returns the same (valid rows, errors) pair.
+def validate_with_pydantic(df):
+    from datetime import date
+    from pydantic import BaseModel, ValidationError, field_validator
+
+    class HateCrimes(BaseModel):
+        occurrence_date: date  # must be of the form yyyy-mm-dd
+        reported_date: date  # must be of the form yyyy-mm-dd
+        division: str  # must be a string
+        location_type: str  # must be a string
+        primary_offence: str  # must be a string
+        neighbourhood: str  # must be a string
+        arrest: str  # should be yes or no
+
+        @field_validator("division", "location_type", "primary_offence", "neighbourhood")
+        def reject_not_allowed(cls, v, info):
+            if v in SCHEMA[info.field_name].get("not_allowed", []):
+                raise ValueError(f'"{v}" is not an allowed value for {info.field_name}')
+            return v
+
+    validated_data = []
+    errors = []
+    for i, row in enumerate(df.to_dicts()):
+        try:
+            validated_data.append(HateCrimes(**row).model_dump())
+        except ValidationError as e:
+            for error in e.errors():
+                errors.append({"row": i, "column": str(error["loc"][0]), "error": error["msg"]})
+    valid = pl.DataFrame(validated_data, schema={c: pl.Date if r["type"] == "date" else pl.String for c, r in SCHEMA.items()})
+    errors = pl.DataFrame(errors, schema={"row": pl.UInt32, "column": pl.String, "error": pl.String})
+    return valid, errors
+
+
+#### Print the results ####
+def report(valid, errors):
+    print("Validated Rows:")
+    print(valid)
+
+    if errors.height:
+        print("\nErrors:")
+        for row in errors.group_by("row", maintain_order=True).agg(pl.format("{}: {}", "column", "error")).iter_rows():
+            print(f"Row {row[0]}: " + "; ".join(row[1]))
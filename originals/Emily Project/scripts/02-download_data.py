@@ -8,13 +8,59 @@
 
 
 #### Workspace setup ####
+import json
+import os
 import requests
-import csv
-from io import StringIO
+
+# Size of each piece of the response written to disk
+CHUNK_SIZE = 1024 * 1024
+
+# Remembers the resource's CKAN last_modified and HTTP validators (ETag / Last-Modified) from the last download,
+# so an unchanged dataset is not downloaded again (delete it to force a full download)
+CACHE_PATH = "data/01-raw_data/.http_cache.json"
+
+
+#### Download helper ####
+# Streams the response to disk in chunks so the dump is never held in memory (or re-serialised),
+# writing to "<path>.part" first and renaming it once complete so a failed download never leaves a partial file.
+# If the file is already on disk, the request is conditional, and "304 Not Modified" returns None without downloading.
+# REFERENCE: https://requests.readthedocs.io/en/latest/user/advanced/#body-content-workflow
+# REFERENCE: https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+def stream_to_file(url, path, cached=None):
+    headers = {}
+    if cached is not None and os.path.exists(path):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("http_last_modified"):
+            headers["If-Modified-Since"] = cached["http_last_modified"]
+    partial = path + ".part"
+    with requests.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        try:
+            with open(partial, "wb") as output_file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    output_file.write(chunk)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+    os.replace(partial, path)
+    return {"etag": response.headers.get("ETag"), "http_last_modified": response.headers.get("Last-Modified")}
+
 
 #### Download data ####
+if os.path.exists(CACHE_PATH):
+    with open(CACHE_PATH) as cache_file:
+        http_cache = json.load(cache_file)
+else:
+    http_cache = {}
+
 # REFERENCE: From the Open Data Toronto website
-url = "https://ckan0.cf.opendata.inter.prod-toronto.ca/api/3/action/package_show"
+# Set CKAN_BASE_URL to use another CKAN instance (e.g., scripts/ckan_fixture_server.py to run offline)
+base_url = os.environ.get("CKAN_BASE_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca").rstrip("/")
+url = base_url + "/api/3/action/package_show"
 params = { "id": "catalogue-quality-scores"} # Contains the dataset we want to retrieve 
 package = requests.get(url, params = params).json()
  
@@ -23,11 +69,22 @@ for idx, resource in enumerate(package["result"]["resources"]):
     # for datastore_active resources:
     if resource["datastore_active"]:
         # To get all records in CSV format:
-        url = "https://ckan0.cf.opendata.inter.prod-toronto.ca/datastore/dump/" + resource["id"]
+        url = base_url + "/datastore/dump/" + resource["id"]
         
-        # Referenced: https://stackoverflow.com/questions/42834861/csv-file-from-string-output
         #### Save data as a CSV ####
-        reader = csv.reader(StringIO(requests.get(url).text), skipinitialspace=True)
-        with open('data/01-raw_data/raw_data.csv', 'w') as output_file:
-            writer = csv.writer(output_file)
-            writer.writerows(reader) # Write in rows into the new file
\ No newline at end of file
+        path = "data/01-raw_data/raw_data.csv"
+        cached = http_cache.get(resource["id"])
+        if (cached is not None and os.path.exists(path)
+                and resource.get("last_modified") is not None
+                and cached["last_modified"] == resource["last_modified"]):
+            print("Unchanged since last download: " + path)  # same CKAN last_modified, no request needed
+            continue
+        validators = stream_to_file(url, path, cached)
+        if validators is None:
+            print("Not modified: " + path)
+            validators = {"etag": cached["etag"], "http_last_modified": cached["http_last_modified"]}
+        http_cache[resource["id"]] = {**validators, "last_modified": resource.get("last_modified")}
+
+# Remember what was fetched for next time
+with open(CACHE_PATH, "w") as cache_file:
+    json.dump(http_cache, cache_file, indent=2)
\ No newline at end of file
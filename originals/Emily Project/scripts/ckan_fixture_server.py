@@ -0,0 +1,97 @@
+#### Preamble ####
+# Purpose: Serves a saved copy of the catalogue quality scores through a local, CKAN-compatible API
+# so 02-download_data.py can run offline (e.g., for repeatable timing runs)
+# Author: Emily Su
+# Date: 7 May 2025
+# Contact: em.su@mail.utoronto.ca
+# License: MIT
+# Pre-requisites: None beyond Python itself (standard library only).
+# Run "python scripts/ckan_fixture_server.py [--port 8000] [--data-dir data/01-raw_data]" from the project folder, then
+# "CKAN_BASE_URL=http://127.0.0.1:8000 python scripts/02-download_data.py" in another terminal.
+# Serves only what 02-download_data.py uses: package_show and /datastore/dump/<id>.
+# The CSV is raw_data.csv in the data folder, or analysis_data.csv if there is none. The data folder defaults to
+# data/01-raw_data, or data/02-analysis_data if no raw download is on disk (analysis_data.csv has every column
+# 03-clean_data.py selects).
+# REFERENCE: https://docs.python.org/3/library/http.server.html
+
+
+#### Workspace setup ####
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PACKAGE_ID = "catalogue-quality-scores"
+RESOURCE_ID = "catalogue-quality-scores-data"
+
+parser = argparse.ArgumentParser(description="Offline CKAN stand-in server.")
+parser.add_argument("--port", type=int, default=8000)
+parser.add_argument("--data-dir", default=None)
+args = parser.parse_args()
+port = args.port
+if args.data_dir is not None:
+    data_dir = args.data_dir
+elif os.path.exists("data/01-raw_data/raw_data.csv"):
+    data_dir = "data/01-raw_data"
+else:
+    data_dir = "data/02-analysis_data"
+csv_path = os.path.join(data_dir, "raw_data.csv")
+if not os.path.exists(csv_path):
+    csv_path = os.path.join(data_dir, "analysis_data.csv")
+
+
+#### Request handler ####
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/3/action/package_show" and parse_qs(url.query).get("id") == [PACKAGE_ID]:
+            modified = datetime.fromtimestamp(os.path.getmtime(csv_path), timezone.utc)
+            resource = {
+                "id": RESOURCE_ID,
+                "name": PACKAGE_ID,
+                "format": "CSV",
+                "datastore_active": True,
+                "last_modified": modified.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            }
+            self.send_json({"success": True, "result": {"name": PACKAGE_ID, "resources": [resource]}})
+        elif url.path == "/datastore/dump/" + RESOURCE_ID:
+            self.send_csv()
+        else:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+
+    # Streams the CSV, with an ETag / Last-Modified so conditional requests get "304 Not Modified"
+    def send_csv(self):
+        stat = os.stat(csv_path)
+        etag = '"' + hashlib.sha256(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.end_headers()
+        with open(csv_path, "rb") as csv_file:
+            shutil.copyfileobj(csv_file, self.wfile)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+#### Serve ####
+server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+print("Serving " + csv_path + " on http://127.0.0.1:" + str(server.server_port))
+server.serve_forever()
@@ -5,23 +5,76 @@
 # Contact: evelyn.hughes@mail.utoronto.ca
 # License: MIT
 # Pre-requisites: 
-  # - `polars` must be installed (pip install polars)
-  # - `numpy` must be installed (pip install numpy)
-  # - `io` must be installed (pip install io)
+  # - `requests` must be installed (pip install requests)
+# Notes:
+  # - Each resource's year comes from its CKAN metadata (the year in its name, e.g., "ob_report_2024"), not from the
+  #   order CKAN lists the resources in, so the same resource always lands in the same file.
+  # - The dumps are downloaded concurrently (one thread per resource, up to max_workers) and written to disk
+  #   byte-for-byte as served.
+  # - A report keeps its file (and the date in its name) until its content changes: only a download whose bytes
+  #   differ from the saved report is kept as a new "<today>_ob_report_<year>.csv" (replacing the old file).
 
 #### Workspace setup ####
-import polars as pl
-from io import StringIO
+import filecmp
+import glob
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 #### Download data ####
 import requests
 
+# Size of each piece of the response written to disk
+chunk_size = 1024 * 1024
+
+# Number of reports downloaded at once
+max_workers = 8
+
+# Remembers each resource's CKAN last_modified, HTTP validators (ETag / Last-Modified) and the file it was saved to,
+# so unchanged reports are not downloaded again (delete it to force a full download)
+cache_path = "data/01-raw_data/.http_cache.json"
+if os.path.exists(cache_path):
+       with open(cache_path) as f:
+              http_cache = json.load(f)
+else:
+       http_cache = {}
+
+# Streams a URL to disk chunk by chunk (the whole dump is never held in memory),
+# writing to "<path>.part" first and renaming it when complete so a failed download never leaves a partial file.
+# If we have the file already, the request is conditional, and "304 Not Modified" returns None without downloading.
+# https://requests.readthedocs.io/en/latest/user/advanced/#body-content-workflow
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+def stream_to_file(url, path, cached = None):
+       headers = {}
+       if cached is not None and os.path.exists(cached["file"]):
+              if cached.get("etag"):
+                     headers["If-None-Match"] = cached["etag"]
+              if cached.get("http_last_modified"):
+                     headers["If-Modified-Since"] = cached["http_last_modified"]
+       partial = path + ".part"
+       with requests.get(url, headers = headers, stream = True) as response:
+              if response.status_code == 304:
+                     return None
+              response.raise_for_status()
+              try:
+                     with open(partial, "wb") as f:
+                            for chunk in response.iter_content(chunk_size = chunk_size):
+                                   f.write(chunk)
+              except BaseException:
+                     if os.path.exists(partial):
+                            os.remove(partial)
+                     raise
+       os.replace(partial, path)
+       return {"etag": response.headers.get("ETag"), "http_last_modified": response.headers.get("Last-Modified")}
+
 # Toronto Open Data is stored in a CKAN instance. It's APIs are documented here:
 # https://docs.ckan.org/en/latest/api/
 
 # To hit our API, you'll be making requests to:
-base_url = "https://ckan0.cf.opendata.inter.prod-toronto.ca"
+# (set CKAN_BASE_URL to use another CKAN instance, e.g. scripts/ckan_fixture_server.py to run offline)
+base_url = os.environ.get("CKAN_BASE_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca").rstrip("/")
 
 # Datasets are called "packages". Each package can contain many "resources"
 # To retrieve the metadata for this package and its resources, use the package name in this page's URL:
@@ -29,18 +82,82 @@ url = base_url + "/api/3/action/package_show"
 params = { "id": "outbreaks-in-toronto-healthcare-institutions"}
 package = requests.get(url, params = params).json()
 
+# The year a resource covers, from its name (e.g., "ob_report_2024"); None if the name has no year
+# https://docs.ckan.org/en/latest/api/index.html#ckan.logic.action.get.package_show
+def resource_year(resource):
+       match = re.search(r"(?<!\d)(\d{4})(?!\d)", resource.get("name") or "")
+       return int(match.group(1)) if match else None
+
+# The saved report of a year (the most recent download, if there are several); None if there is none yet
+def saved_report(year):
+       saved = sorted(glob.glob("data/01-raw_data/*_ob_report_" + str(year) + ".csv"))
+       return saved[-1] if saved else None
+
+# Downloads one resource to its year's file (run in a worker thread); returns its cache entry and a message
+def fetch(resource, year):
+       # To get all records in CSV format:
+       url = base_url + "/datastore/dump/" + resource["id"]
+       path = "data/01-raw_data/" + date + "_ob_report_" + str(year) + ".csv"
+       cached = http_cache.get(resource["id"])
+       if cached is not None and os.path.exists(cached["file"]):
+            previous = cached["file"]
+       else:
+            cached = None
+            previous = saved_report(year)
+
+       # Unchanged since the last download (same CKAN last_modified): no request needed
+       if (cached is not None
+               and resource.get("last_modified") is not None
+               and cached["last_modified"] == resource["last_modified"]):
+            validators = None
+       else:
+            # Writing raw data to CSV (streamed as-is, no parsing)
+            validators = stream_to_file(url, path, cached)
+            # Same bytes as the saved report (e.g., a server without validators): keep the saved file
+            if (validators is not None and previous is not None and previous != path
+                    and filecmp.cmp(previous, path, shallow = False)):
+                 os.remove(path)
+                 return {**validators, "file": previous, "last_modified": resource.get("last_modified")}, "Unchanged: " + previous
+
+       # Not re-downloaded: the saved file stays as it is
+       if validators is None:
+            validators = {"etag": cached["etag"], "http_last_modified": cached["http_last_modified"]}
+            return {**validators, "file": previous, "last_modified": resource.get("last_modified")}, "Unchanged: " + previous
+
+       # the older download of this year is superseded
+       if previous is not None and previous != path:
+            os.remove(previous)
+       return {**validators, "file": path, "last_modified": resource.get("last_modified")}, "Saved: " + path
+
 # To get resource data:
 date = str(datetime.today()).split()[0]
-year = int(date[:4])
-for idx, resource in enumerate(package["result"]["resources"]):
+years = {}
+for resource in package["result"]["resources"]:
 
        # for datastore_active resources:
        if resource["datastore_active"]:
-            # To get all records in CSV format:
-            url = base_url + "/datastore/dump/" + resource["id"]
-            resource_dump_data = requests.get(url)
-
-            # Writing raw data to CSV
-            analysis_data = pl.read_csv(StringIO(resource_dump_data.text))
-            analysis_data.write_csv("data/01-raw_data/" + date + "_ob_report_" + str(year) + ".csv")
-            year-=1
\ No newline at end of file
+            year = resource_year(resource)
+            if year is None:
+                 print("Skipped (no year in its name): " + str(resource.get("name")))
+                 continue
+            if year in years:
+                 raise ValueError("Two resources for " + str(year) + ": " + years[year]["id"] + ", " + resource["id"])
+            years[year] = resource
+
+# Downloading every report at once
+failed = []
+with ThreadPoolExecutor(max_workers = max_workers) as executor:
+       fetches = {resource["id"]: executor.submit(fetch, resource, year) for year, resource in sorted(years.items())}
+       for resource_id, future in fetches.items():
+            try:
+                 http_cache[resource_id], message = future.result()
+            except Exception as error:
+                 failed.append(resource_id)
+                 message = "Failed: " + resource_id + " (" + str(error) + ")"
+            print(message)
+
+# Remember what was fetched for next time (including the downloads that did succeed)
+with open(cache_path, "w") as f:
+       json.dump(http_cache, f, indent = 2)
+if failed:
+       raise RuntimeError("Could not download: " + ", ".join(failed))
@@ -4,154 +4,165 @@
 # Date: 13 May 2025
 # Contact: evelyn.hughes@mail.utoronto.ca
 # License: MIT
-# Pre-requisites: 
+# Pre-requisites:
   # -  02-download_data.py must have been run
   # - `polars` must be installed (pip install polars)
+# Notes:
+  # - Outbreaks are classified column by column, not row by row: the causative agents are lowercased once and every
+  #   disease pattern is found in one pass (str.extract_many, overlapping matches), and both tables come from a
+  #   single group_by over all years.
+  # - Every yearly report is scanned lazily in one query (scan_reports): each file's header is read once, its
+  #   column-name variants are renamed to one canonical schema, and a report_year column is taken from the file
+  #   name. Polars then reads and aggregates the files in parallel.
+  # - The counting rules are unchanged: "influenza " keeps its trailing space (so "Parainfluenza 3" also counts as
+  #   Influenza), and an outbreak naming both "covid" and "corona" counts twice towards Coronavirus.
+  # - Each year is read from its most recent report (whatever day it was downloaded), and counted incrementally:
+  #   .cache/partial_counts.csv (ignored by git) keeps every year's counts with the hash of the report (and of this
+  #   script) they came from, so only years whose report changed - normally just the current one - are counted
+  #   again before the partials are merged into the final tables. Delete it to recount every year.
 
 #### Workspace setup ####
+import glob
+import hashlib
+import os
+import re
 import polars as pl
-from datetime import datetime
 
 #constant variables
-date = str(datetime.today()).split()[0]
-MONTHS = ["January", "February", "March", "April", 
+MONTHS = ["January", "February", "March", "April",
                              "May", "June", "July", "August", "September", "October", "November", "December"]
-YEARS = ["2019", "2020", "2021", "2022", "2023", "2024"]
-DISEASE_COLUMNS = ["Coronavirus", "Influenza", "Syncytial Virus", 
+YEARS = [2019, 2020, 2021, 2022, 2023, 2024]
+DISEASE_COLUMNS = ["Coronavirus", "Influenza", "Syncytial Virus",
                    "Metapneumovirus", "Rhinovirus", "Parainfluenza", "Respiratory", "Total"]
 
-#initializing dictionaries
-disease_count = dict()
-disease_count["Year"] = YEARS
-disease_count["Coronavirus"] = [0, ]*6
-disease_count["Other"] = [0, ]*6
-disease_count["Unknown"] = [0, ]*6
-disease_count["Total Agents"] = [0, ]*6
-
-#general disease -> list of # of outbreaks in each year
-yearly_disease_count = dict()
-yearly_disease_count["Year"] = YEARS
-for column in DISEASE_COLUMNS:
-  yearly_disease_count[column] = [0, ]*6
-yearly_disease_count["Respiratory"] =[0, ]*6
-yearly_disease_count["Total"] = [0, ]*6
+#canonical names of columns whose header changed over the years ("Causative Agent-1" became "Causative Agent - 1")
+COLUMN_VARIANTS = {"Causative Agent-1": "agent_one", "Causative Agent - 1": "agent_one",
+                   "Causative Agent-2": "agent_two", "Causative Agent - 2": "agent_two"}
+
+#pattern (in a lowercased causative agent) -> yearly_disease_count column it counts towards
+DISEASE_PATTERNS = {"covid": "Coronavirus", "corona": "Coronavirus", "influenza ": "Influenza",
+                    "metapneumovirus": "Metapneumovirus", "rhinovirus": "Rhinovirus",
+                    "parainfluenza": "Parainfluenza", "syncytial": "Syncytial Virus"}
+#also matched: the composition table's "Unknown" agents
+PATTERNS = list(DISEASE_PATTERNS) + ["unable"]
+
+#per-year counts from earlier runs, with the hash of the report each came from
+PARTIAL_COUNTS = ".cache/partial_counts.csv"
 
 #### Clean data ####
 
-## Finding composition based on primary causative agents ##
-
-for year in range(2019, 2025):
-    raw = pl.read_csv("data/01-raw_data/" + date + "_ob_report_" + str(year) + ".csv")
-    for row in raw.rows(named = True):
-       #index
-        index = year - 2019
-
-       #getting disease type, only check common respiratory
-        disease_type = row["Type of Outbreak"]
-        if disease_type != "Respiratory":
-            continue
-       
-        #getting causative agents
-        if "Causative Agent-1" in row.keys():
-            disease_one = row["Causative Agent-1"]
-        else:
-            disease_one = row["Causative Agent - 1"]
-
-        if "Causative Agent-2" in row.keys():
-            disease_two = row["Causative Agent-2"]
-        else:
-            disease_two = row["Causative Agent - 2"]
-         
-        #updating count from disease_one
-        disease_count["Total Agents"][index] += 1
-        if "covid" in disease_one.lower() or "corona" in disease_one.lower():
-            disease_count["Coronavirus"][index] += 1
-        elif "unable" in disease_one.lower():
-            disease_count["Unknown"][index] += 1
-        else:
-            disease_count["Other"][index] += 1
-        
-        if disease_two != None and disease_two != "" and disease_two != "None":
-            disease_count["Total Agents"][index] += 1
-            if "covid" in disease_two.lower() or "corona" in disease_two.lower():
-                disease_count["Coronavirus"][index] += 1
-            elif "unable" in disease_two.lower():
-                disease_count["Unknown"][index] += 1
-            else:
-                disease_count["Other"][index] += 1
-
-## summing total cases for the year
-for year in range(2016, 2026):
-    if year not in [2019, 2020, 2021, 2022, 2023, 2024]:
-        continue
-
-    # reading & iterating through csv
-    raw = pl.read_csv("data/01-raw_data/" + date + "_ob_report_" + str(year) + ".csv")
-    for row in raw.rows(named = True):
-        #getting disease type
-        disease_type = row["Type of Outbreak"]
-
-        #getting causative agent
-        if "Causative Agent-1" in row.keys():
-            disease_one = row["Causative Agent-1"]
-        else:
-            disease_one = row["Causative Agent - 1"]
-         
-        if "Causative Agent-2" in row.keys():
-            disease_two = row["Causative Agent-2"]
-        else:
-            disease_two = row["Causative Agent - 2"]
-
-        #updating yearly total count
-        index = year - 2019
-        yearly_disease_count["Total"][index] += 1
-
-        #updating yearly total respiratory count
-        if "respiratory" in disease_type.lower():
-            yearly_disease_count["Respiratory"][index] += 1
-
-        #updating yearly total influenza count
-        if (disease_one is not None and "influenza " in disease_one.lower()) or (
-            disease_two is not None and "influenza " in disease_two.lower()):
-            yearly_disease_count["Influenza"][index] += 1
-        
-        #updating yearly total coronavirus/covid count
-        if (disease_one is not None and "covid" in disease_one.lower()) or (
-            disease_two is not None and "covid" in disease_two.lower()):
-            yearly_disease_count["Coronavirus"][index] += 1
-
-        if (disease_one is not None and "corona" in disease_one.lower()) or (
-            disease_two is not None and "corona" in disease_two.lower()):
-            yearly_disease_count["Coronavirus"][index] += 1
-
-        #updating yearly total Metapneumovirus
-        if (disease_one is not None and "metapneumovirus" in disease_one.lower()) or (
-            disease_two is not None and "metapneumovirus" in disease_two.lower()):
-            yearly_disease_count["Metapneumovirus"][index] += 1
-        
-        #updating yearly total Rhinovirus
-        if (disease_one is not None and "rhinovirus" in disease_one.lower()) or (
-            disease_two is not None and "rhinovirus" in disease_two.lower()):
-            yearly_disease_count["Rhinovirus"][index] += 1
-
-        #updating yearly total Parainfluenza
-        if (disease_one is not None and "parainfluenza" in disease_one.lower()) or (
-            disease_two is not None and "parainfluenza" in disease_two.lower()):
-            yearly_disease_count["Parainfluenza"][index] += 1
-
-         #updating yearly total Respiratory syncytial virus
-        if (disease_one is not None and "syncytial" in disease_one.lower()) or (
-            disease_two is not None and "syncytial" in disease_two.lower()):
-            yearly_disease_count["Syncytial Virus"][index] += 1
+## Finding each year's report ##
+# Reports are named <download date>_ob_report_<year>.csv; the most recent download of each year is used.
+def latest_reports(pattern):
+    reports = {}
+    for path in sorted(glob.glob(pattern)):  # ISO dates sort in time order, so later downloads win
+        year = int(re.search(r"_ob_report_(\d{4})\.csv$", path).group(1))
+        reports[year] = path
+    return reports
+
+reports = {year: path for year, path in latest_reports("data/01-raw_data/*_ob_report_*.csv").items()
+           if year in YEARS}
+missing = [year for year in YEARS if year not in reports]
+if missing:
+    raise FileNotFoundError("No outbreak report in data/01-raw_data/ for " + ", ".join(map(str, missing)))
+
+## Which years need counting ##
+# A year's partial counts are reused if its report and this script (the counting rules) are unchanged
+with open(__file__, "rb") as f:
+    rules_hash = hashlib.sha256(f.read()).hexdigest()
+
+def report_hash(path):
+    digest = hashlib.sha256(rules_hash.encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+hashes = pl.DataFrame({"report_year": list(reports), "source_hash": [report_hash(p) for p in reports.values()]})
+if os.path.exists(PARTIAL_COUNTS):
+    reused = pl.read_csv(PARTIAL_COUNTS).join(hashes, on = ["report_year", "source_hash"], how = "semi")
+else:
+    reused = None
+stale = [year for year in reports if reused is None or year not in reused["report_year"]]
+for year in reports:
+    print(("Counting: " if year in stale else "Unchanged: ") + str(year))
+
+## Reading the stale years' outbreaks into one table ##
+# One lazy scan per report, harmonised to the canonical schema, concatenated into a single query.
+# (A single glob scan_csv would fail on the header drift, so the files are matched here instead.)
+# https://docs.pola.rs/user-guide/io/multiple/
+def scan_reports(paths):
+    scans = []
+    for year, path in paths.items():
+        report = pl.scan_csv(path, infer_schema = False)  # every column as text: same types in every year
+        report = report.rename({column: COLUMN_VARIANTS[column] for column in report.collect_schema().names()
+                                if column in COLUMN_VARIANTS})
+        scans.append(report.with_columns(pl.lit(year, dtype = pl.Int64).alias("report_year")))
+    return pl.concat(scans, how = "diagonal")
+
+## Matching every disease pattern in one pass per causative agent ##
+# https://docs.pola.rs/api/python/stable/reference/expressions/api/polars.Expr.str.extract_many.html
+matched_columns = [
+    pl.col("agent_one", "agent_two").str.to_lowercase()
+      .str.extract_many(PATTERNS, overlapping = True).name.suffix("_matches"),
+    # a second agent is only counted when one was given
+    (pl.col("agent_two").is_not_null() & ~pl.col("agent_two").is_in(["", "None"])).alias("has_agent_two"),
+]
+
+def matches(agent, pattern):
+    return pl.col(agent + "_matches").list.contains(pattern).fill_null(False)
+
+def either_matches(pattern):
+    return matches("agent_one", pattern) | matches("agent_two", pattern)
+
+## Finding composition based on primary causative agents (respiratory outbreaks only) ##
+# each agent is Coronavirus ("covid" or "corona"), else Unknown ("unable"), else Other
+def is_corona(agent):
+    return matches(agent, "covid") | matches(agent, "corona")
+
+def is_unknown(agent):
+    return ~is_corona(agent) & matches(agent, "unable")
+
+respiratory = pl.col("Type of Outbreak") == "Respiratory"
+second = respiratory & pl.col("has_agent_two")
+composition = {
+    "Coronavirus": (respiratory & is_corona("agent_one")).cast(pl.Int64) + (second & is_corona("agent_two")),
+    "Other": ((respiratory & ~is_corona("agent_one") & ~is_unknown("agent_one")).cast(pl.Int64)
+              + (second & ~is_corona("agent_two") & ~is_unknown("agent_two"))),
+    "Unknown": (respiratory & is_unknown("agent_one")).cast(pl.Int64) + (second & is_unknown("agent_two")),
+    "Total Agents": respiratory.cast(pl.Int64) + second,
+}
+
+## Summing total cases for the year (every outbreak type) ##
+# an outbreak counts once per pattern found in either agent
+yearly = {column: pl.lit(0, dtype = pl.Int64) for column in DISEASE_COLUMNS}
+for pattern, column in DISEASE_PATTERNS.items():
+    yearly[column] = yearly[column] + either_matches(pattern)
+yearly["Respiratory"] = pl.col("Type of Outbreak").str.to_lowercase().str.contains("respiratory", literal = True).cast(pl.Int64)
+yearly = {column: expression.sum() for column, expression in yearly.items()}
+yearly["Total"] = pl.len().cast(pl.Int64)
+
+## One group_by over the stale years for both tables, merged with the reused partials ##
+partials = [] if reused is None else [reused]
+if stale:
+    outbreaks = scan_reports({year: reports[year] for year in stale})
+    partials.append(
+        outbreaks.with_columns(matched_columns)
+        .group_by("report_year")
+        .agg([expression.sum().alias("composition " + column) for column, expression in composition.items()]
+             + [expression.alias("yearly " + column) for column, expression in yearly.items()])
+        .join(hashes.lazy(), on = "report_year")
+        .collect()
+    )
+counts = pl.concat(partials, how = "diagonal_relaxed").sort("report_year")
+os.makedirs(os.path.dirname(PARTIAL_COUNTS), exist_ok = True)
+counts.write_csv(PARTIAL_COUNTS)
 
 ### SAVE TO CSV ###
 #saving respiratory diseases with high count
-df = pl.DataFrame(disease_count)
+df = counts.select(pl.col("report_year").alias("Year"), *[pl.col("composition " + column).alias(column) for column in composition])
 df.write_csv("data/02-analysis_data/disease_count.csv")
 
 #saving yearly respiratory disease counts
-df = pl.DataFrame(yearly_disease_count)
+df = counts.select(pl.col("report_year").alias("Year"), *[pl.col("yearly " + column).alias(column) for column in DISEASE_COLUMNS])
 df.write_csv("data/02-analysis_data/yearly_disease_count.csv")
-
-
-
@@ -0,0 +1,88 @@
+#### Preamble ####
+# Purpose: Serves the saved outbreak reports through a local, CKAN-compatible API so the download can run offline
+# Author: Evelyn Hughes
+# Date: 14 May 2025
+# Contact: evelyn.hughes@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+  # - nothing to install (standard library only)
+  # - run "python scripts/ckan_fixture_server.py [--port 8000] [--data-dir data/01-raw_data]" from the project folder,
+  #   then "CKAN_BASE_URL=http://127.0.0.1:8000 python scripts/01-download_data.py" in another terminal
+  # - serves only what 01-download_data.py uses: package_show and /datastore/dump/<id>, one resource per
+  #   "<date>_ob_report_<year>.csv" in the data folder (newest year first, like Open Data Toronto)
+  # - pass a copy of data/01-raw_data as --data-dir, since 01-download_data.py writes into data/01-raw_data
+  # - https://docs.python.org/3/library/http.server.html
+
+#### Workspace setup ####
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PACKAGE_ID = "outbreaks-in-toronto-healthcare-institutions"
+parser = argparse.ArgumentParser(description = "Offline CKAN stand-in server.")
+parser.add_argument("--port", type = int, default = 8000)
+parser.add_argument("--data-dir", default = "data/01-raw_data")
+args = parser.parse_args()
+port = args.port
+data_folder = args.data_dir
+
+#### Resources: the latest saved report for each year ####
+reports = {}
+for name in sorted(os.listdir(data_folder)):
+  match = re.fullmatch(r".*_ob_report_(\d{4})\.csv", name)
+  if match:
+    reports["ob-report-" + match.group(1)] = os.path.join(data_folder, name)
+resource_ids = sorted(reports, reverse = True)
+
+class Handler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    url = urlparse(self.path)
+    if url.path == "/api/3/action/package_show" and parse_qs(url.query).get("id") == [PACKAGE_ID]:
+      resources = []
+      for resource_id in resource_ids:
+        modified = datetime.fromtimestamp(os.path.getmtime(reports[resource_id]), timezone.utc)
+        resources.append({"id": resource_id, "name": resource_id.replace("-", "_"), "format": "CSV",
+                          "datastore_active": True, "last_modified": modified.strftime("%Y-%m-%dT%H:%M:%S.%f")})
+      self.send_json({"success": True, "result": {"name": PACKAGE_ID, "resources": resources}})
+    elif url.path.startswith("/datastore/dump/") and url.path[len("/datastore/dump/"):] in reports:
+      self.send_file(reports[url.path[len("/datastore/dump/"):]])
+    else:
+      self.send_json({"success": False, "error": "Not found"}, 404)
+
+  # Streams the file, with an ETag / Last-Modified so conditional requests get "304 Not Modified"
+  def send_file(self, path):
+    stat = os.stat(path)
+    etag = '"' + hashlib.sha256(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()[:16] + '"'
+    if self.headers.get("If-None-Match") == etag:
+      self.send_response(304)
+      self.send_header("ETag", etag)
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header("Content-Type", "text/csv")
+    self.send_header("Content-Length", str(stat.st_size))
+    self.send_header("ETag", etag)
+    self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt = True))
+    self.end_headers()
+    with open(path, "rb") as f:
+      shutil.copyfileobj(f, self.wfile)
+
+  def send_json(self, payload, status = 200):
+    body = json.dumps(payload).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+#### Serve ####
+server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+print("Serving " + str(len(reports)) + " reports from " + data_folder + " on http://127.0.0.1:" + str(server.server_port))
+server.serve_forever()
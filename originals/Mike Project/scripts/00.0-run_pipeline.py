@@ -7,20 +7,48 @@
 # Pre-requisites:
 # - Imports `importlib` to load and run scripts with prefix-numbered filenames.
 # - Each script must define a `main()` function.
+# - Each script must declare the files it reads and writes in module-level `INPUTS` and `OUTPUTS` lists.
 # - Progress messaging is handled inside each script's `main()`.
+# - Stages may declare a `PARAMS` dictionary; it is part of the build-cache fingerprint (see build_cache.py).
+# - Stages that check their own freshness (e.g., 02.0's HTTP cache) set `ALWAYS_RUN = True` to bypass the build cache.
+# - Run with "python scripts/00.0-run_pipeline.py [--jobs N] [--force [STAGE ...]]" from the project root,
+#   or with "--in-memory [--persist PATH ...]" to hand tables between stages without CSV round-trips.
+# - "--format parquet" (or ipc) stores the analysis tables as Parquet / Arrow IPC instead of CSV.
+# - "--engine minibatch" clusters with streaming MiniBatchKMeans instead of KMeans (see clustering.py).
+# - "--bootstrap N" adds 08.0's bootstrap cluster-stability evaluation (N resamples per model).
+# - Every stage is measured (wall and CPU time, peak memory, rows and bytes of its inputs and outputs; see
+#   run_log.py): one JSON line per stage is appended to .cache/pipeline/run_log.jsonl (or "--run-log PATH"),
+#   and a summary table is printed at the end. "--trace-memory" also records tracemalloc's peak.
 # References:
 # - [https://realpython.com/python-main-function/]
+# - [https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor]
 
 #### Workplace setup ####
-import importlib.util
-from pathlib import Path
-import traceback
-
+import argparse  # For the command-line options (number of parallel workers)
 import importlib.util  # For loading scripts dynamically
+import inspect  # For checking whether a stage's main() accepts the artifact store
+import os  # For counting available CPU cores
+from functools import partial  # For passing the artifact store to a stage's main()
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)  # For running independent stages in parallel processes
 from pathlib import Path  # For handling file paths
 import traceback  # For printing full error tracebacks
 
+from build_cache import BuildCache  # For skipping stages whose outputs are up to date
+from pipeline_io import ArtifactStore  # For handing DataFrames between stages in memory
+from run_log import (
+    RUN_LOG,
+    measure_stage,
+    new_run_id,
+    print_summary,
+    write_run_log,
+)  # For per-stage timing, memory and row counts
+
 #### Pipeline: ordered list of Python filenames (no need for ".py") ####
+# The order still matters: when two stages write the same file, a reader depends on the latest writer listed before it.
 pipeline = [
     "01.0-simulate_data",
     "02.0-download_data",
@@ -47,23 +75,307 @@ def import_module_from_file(script_file: Path):
     return module
 
 
+#### Run a single stage (executed inside a worker process) ####
+# Returns the stage's run-log record (see run_log.measure_stage); a failure is recorded rather than raised.
+def run_stage(filename: str, trace_memory: bool = False) -> dict:
+    script_path = Path(__file__).parent / f"{filename}.py"  # Absolute path to script
+    print(f"Running: {filename}.py")
+    module = import_module_from_file(script_path)  # Load script as module
+    return measure_stage(
+        filename, module, module.main, trace_memory=trace_memory
+    )  # Call its main() function
+
+
+#### Build the dependency graph from each stage's declared INPUTS / OUTPUTS ####
+# A stage depends on:
+# - the latest earlier stage that writes one of its inputs (read-after-write), and
+# - every earlier stage that reads or writes one of its outputs (so files are never overwritten too early).
+# Returns the loaded modules, {stage: set of stages it must wait for},
+# {stage: {input: stage that writes it}} and {file: final stage that writes it}.
+def build_dependency_graph(stages: list[str]):
+    script_directory = Path(__file__).parent
+    modules = {}
+    dependencies = {}
+    producers = {}
+    last_writer = {}  # file -> latest stage (so far) that writes it
+    readers_writers = {}  # file -> every stage (so far) that reads or writes it
+
+    for filename in stages:
+        module = import_module_from_file(script_directory / f"{filename}.py")
+        inputs = getattr(module, "INPUTS", [])
+        outputs = getattr(module, "OUTPUTS", [])
+
+        needs = set()
+        producers[filename] = {}
+        for path in inputs:
+            if path in last_writer and last_writer[path] != filename:
+                needs.add(last_writer[path])
+                producers[filename][path] = last_writer[path]
+        for path in outputs:
+            needs.update(readers_writers.get(path, set()))
+        needs.discard(filename)  # a stage may read and rewrite the same file
+        modules[filename] = module
+        dependencies[filename] = needs
+
+        for path in inputs + outputs:
+            readers_writers.setdefault(path, set()).add(filename)
+        for path in outputs:
+            last_writer[path] = filename
+
+    return modules, dependencies, producers, last_writer
+
+
+#### In-memory execution: run every stage in this process, sharing one ArtifactStore ####
+# Tables are passed between stages as DataFrames; only `persist` paths and final outputs (files no stage reads) hit disk.
+# Stages run in pipeline order (already a valid dependency order); the build cache is not used, since
+# intermediate tables are not on disk to be checked. Each stage's run-log record is appended to `records`.
+def run_in_memory(
+    modules, dependencies, persist, records: list[dict], trace_memory: bool = False
+) -> bool:
+    consumed = {path for module in modules.values() for path in module.INPUTS}
+    produced = {path for module in modules.values() for path in module.OUTPUTS}
+    artifacts = ArtifactStore(persist=(produced - consumed) | set(persist))
+    failed = set()
+
+    for stage, module in modules.items():
+        if dependencies[stage] & failed:
+            print(f"Skipping: {stage}.py (upstream stage failed)")
+            records.append({"stage": stage, "status": "skipped"})
+            failed.add(stage)
+            continue
+        print(f"Running: {stage}.py")
+        if "artifacts" in inspect.signature(module.main).parameters:
+            call = partial(module.main, artifacts=artifacts)
+        else:
+            call = module.main
+        record = measure_stage(stage, module, call, artifacts, trace_memory)
+        records.append(record)
+        if record["status"] == "failed":
+            print(f"Error occurred while running: {stage}.py")
+            print(record["error"], end="")
+            failed.add(stage)
+
+    return not failed
+
+
+#### Process-pool execution: independent stages run in parallel worker processes ####
+# Stages that are up to date (see build_cache.py) are skipped. Each stage's run-log record is appended to `records`.
+def run_in_processes(
+    modules,
+    dependencies,
+    producers,
+    final_writer,
+    jobs,
+    force,
+    records: list[dict],
+    trace_memory: bool = False,
+) -> bool:
+    cache = BuildCache(Path(__file__).parent)
+    remaining = {stage: set(needs) for stage, needs in dependencies.items()}
+    # Stages that raised (or were skipped because of an upstream failure)
+    failed = set()
+
+    # One fresh worker process per stage, so no state (e.g., np.random.seed) leaks between stages
+    # (and each worker's peak memory is its stage's own)
+    # [https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.ProcessPoolExecutor]
+    with ProcessPoolExecutor(
+        max_workers=jobs or os.cpu_count(), max_tasks_per_child=1
+    ) as executor:
+        running = {}  # future -> (stage, fingerprint)
+        while remaining or running:
+            # Skip any stage whose upstream stage failed (repeat so the skip cascades downstream)
+            blocked = [s for s, needs in remaining.items() if needs & failed]
+            while blocked:
+                for stage in blocked:
+                    print(f"Skipping: {stage}.py (upstream stage failed)")
+                    records.append({"stage": stage, "status": "skipped"})
+                    failed.add(stage)
+                    del remaining[stage]
+                blocked = [s for s, needs in remaining.items() if needs & failed]
+
+            # Every stage whose dependencies have all finished is either up to date or submitted
+            ready = [s for s, needs in remaining.items() if not needs]
+            for stage in ready:
+                del remaining[stage]
+                outputs = modules[stage].OUTPUTS
+                fingerprint = cache.fingerprint(stage, modules[stage], producers[stage])
+                forced = (
+                    force is True
+                    or stage in (force or [])
+                    or getattr(modules[stage], "ALWAYS_RUN", False)
+                )
+                final_outputs = {p for p in outputs if final_writer[p] == stage}
+                if not forced and cache.is_up_to_date(
+                    stage, fingerprint, outputs, final_outputs
+                ):
+                    print(f"Up to date: {stage}.py")
+                    records.append({"stage": stage, "status": "up-to-date"})
+                    for needs in remaining.values():
+                        needs.discard(stage)
+                    continue
+                future = executor.submit(run_stage, stage, trace_memory)
+                running[future] = (stage, fingerprint)
+
+            if not running:
+                if ready:
+                    continue  # up-to-date stages may have released new ones
+                break
+
+            # Wait for at least one running stage to finish, then release its dependents
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                error = (
+                    future.exception()
+                )  # the worker itself died (or the stage exited)
+                if error is not None:
+                    record = {
+                        "stage": stage,
+                        "status": "failed",
+                        "error": "".join(traceback.format_exception(error)),
+                    }
+                else:
+                    record = future.result()
+                records.append(record)
+                if record["status"] == "failed":
+                    print(f"Error occurred while running: {stage}.py")
+                    print(record["error"], end="")
+                    failed.add(stage)
+                    continue
+                cache.record(stage, fingerprint, modules[stage].OUTPUTS)
+                for needs in remaining.values():
+                    needs.discard(stage)
+
+    return not failed
+
+
 #### Main Pipeline Execution ####
-def main():
-    for filename in pipeline:
-        script_path = (
-            Path(__file__).parent / f"{filename}.py"
-        )  # Absolute path to script
-        print(f"Running: {filename}.py")
+# `force` = stages to rerun even if the build cache says they are up to date (True = all stages).
+# `storage_format` = "csv", "parquet" or "ipc" for the tables in data/02-analysis_data/ (default: $PIPELINE_FORMAT or csv).
+# `in_memory` / `persist` = hand tables between stages in memory, writing only the `persist` paths (and final outputs).
+# `engine` = "kmeans" or "minibatch" clustering in 05.0 / 08.0 (default: $CLUSTER_ENGINE or kmeans).
+# `bootstrap` = resamples per model for 08.0's stability evaluation (default: $BOOTSTRAP_RESAMPLES or 0 = off).
+# `run_log` = JSON-lines file the stage records are appended to; `trace_memory` = also record tracemalloc's peak.
+# Returns True only if every stage succeeded (or was up to date).
+def main(
+    jobs: int | None = None,
+    force: bool | list[str] = False,
+    in_memory: bool = False,
+    persist: list[str] = (),
+    storage_format: str | None = None,
+    engine: str | None = None,
+    bootstrap: int | None = None,
+    run_log: Path = RUN_LOG,
+    trace_memory: bool = False,
+) -> bool:
+    # Storage format of the analysis tables (read by pipeline_io.table_path when each stage is loaded)
+    if storage_format is not None:
+        os.environ["PIPELINE_FORMAT"] = storage_format
+    # Clustering engine (read by clustering.cluster_engine when each stage is loaded)
+    if engine is not None:
+        os.environ["CLUSTER_ENGINE"] = engine
+    # Bootstrap resamples (read by 08.0 when it is loaded)
+    if bootstrap is not None:
+        os.environ["BOOTSTRAP_RESAMPLES"] = str(bootstrap)
+    run_id = new_run_id()
+    modules, dependencies, producers, final_writer = build_dependency_graph(pipeline)
+    records = []
+    if in_memory:
+        succeeded = run_in_memory(modules, dependencies, persist, records, trace_memory)
+    else:
+        succeeded = run_in_processes(
+            modules,
+            dependencies,
+            producers,
+            final_writer,
+            jobs,
+            force,
+            records,
+            trace_memory,
+        )
 
-        try:
-            module = import_module_from_file(script_path)  # Load script as module
-            module.main()  # Call its main() function
-        except Exception:
-            print(f"Error occurred while running: {filename}.py")
-            traceback.print_exc()
+    # Run log and summary, in pipeline order
+    records.sort(key=lambda record: pipeline.index(record["stage"]))
+    write_run_log(records, run_id, Path(run_log))
+    print_summary(records)
+    print(f"Run log: {run_log} (run {run_id})")
+    return succeeded
 
 
 #### Entry Point ####
 if __name__ == "__main__":
-    main()
-    print("Pipeline completed successfully.")
+    parser = argparse.ArgumentParser(description="Run the crime/profile pipeline.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="maximum number of stages to run at once (default: number of CPU cores)",
+    )
+    parser.add_argument(
+        "--force",
+        nargs="*",
+        metavar="STAGE",
+        default=None,
+        help="rerun the given stages (or every stage, if none are named) even if up to date",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="run stages in one process, passing tables between them as DataFrames",
+    )
+    parser.add_argument(
+        "--persist",
+        nargs="+",
+        metavar="PATH",
+        default=[],
+        help="with --in-memory, intermediate tables to also write to disk",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet", "ipc"],
+        default=None,
+        help="storage format of the analysis tables (default: $PIPELINE_FORMAT or csv)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["kmeans", "minibatch"],
+        default=None,
+        help="clustering engine for 05.0 / 08.0 (default: $CLUSTER_ENGINE or kmeans)",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        metavar="N",
+        default=None,
+        help="bootstrap resamples per model for 08.0's stability evaluation (default: $BOOTSTRAP_RESAMPLES or 0)",
+    )
+    parser.add_argument(
+        "--run-log",
+        type=Path,
+        metavar="PATH",
+        default=RUN_LOG,
+        help=f"JSON-lines file to append per-stage measurements to (default: {RUN_LOG})",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also record each stage's peak traced Python allocation (tracemalloc; slower)",
+    )
+    args = parser.parse_args()
+    force = args.force if args.force else args.force is not None
+
+    if main(
+        jobs=args.jobs,
+        force=force,
+        in_memory=args.in_memory,
+        persist=args.persist,
+        storage_format=args.format,
+        engine=args.engine,
+        bootstrap=args.bootstrap,
+        run_log=args.run_log,
+        trace_memory=args.trace_memory,
+    ):
+        print("Pipeline completed successfully.")
+    else:
+        print("Pipeline finished with errors.")
@@ -8,11 +8,68 @@
 # - `polars` must be installed (pip install polars)
 # - `numpy` must be installed (pip install numpy)
 # - `pytest` must be installed (pip install pytest); run with "pytest -q"
+# Notes:
+# - As a pipeline stage, main() writes the small simulated dataset checked by 01.1-simulated_data_test.py.
+# - "python scripts/01.0-simulate_data.py --raw DIR [--scale X | --areas N] [--years 2014-2024] [--crimes ...]"
+#   instead builds a load-testing workspace in DIR: raw crime and profile inputs in the real schemas (the
+#   203-column crime CSV and the wide profile workbook) for any number of areas, years and offences, plus a
+#   neighbourhood ID index for the synthetic names. Serve DIR/raw with ckan_fixture_server.py and run
+#   00.0-run_pipeline.py from DIR (see the README) to time every stage at 10x, 100x... the real data size.
+# - The crime CSV is written in chunks of CHUNK_ROWS areas, each drawn with vectorised numpy.random.Generator
+#   calls (one child generator per chunk), so only one chunk of offence columns is in memory at a time. The
+#   workbook is streamed row by row as SpreadsheetML inside a zip (standard library only; no Excel writer).
+# - Excel sheets hold at most 16,384 columns, so the profile workbook (one column per area) caps the
+#   workspace at MAX_PROFILE_AREAS areas (about 100x Toronto).
+# - The pipeline analyses 2019-2024 and assault, break and enter, homicide, robbery and shooting, so custom
+#   --years / --crimes must include those for a full pipeline run.
+# References:
+# - [https://numpy.org/doc/stable/reference/random/parallel.html]
+# - [https://learn.microsoft.com/en-us/openspecs/office_standards/ms-xlsx/]
 
 #### Workspace setup ####
+import argparse  # inherent to Python
+import zipfile  # inherent to Python
+from pathlib import Path  # inherent to Python
+from xml.sax.saxutils import escape  # inherent to Python
+
 import polars as pl
 import numpy as np
 
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = []
+OUTPUTS = [
+    "data/00-simulated_data/simulated_data.csv",
+]
+
+#### Raw data generator settings ####
+# Neighbourhoods in the real data (--scale multiplies this)
+REAL_AREAS = 158
+
+# Offences in the real crime CSV, with roughly the city-wide incidents per 1,000 residents (2023)
+OFFENCE_RATES = {
+    "ASSAULT": 7.6,
+    "AUTOTHEFT": 3.8,
+    "BIKETHEFT": 0.95,
+    "BREAKENTER": 2.4,
+    "HOMICIDE": 0.023,
+    "ROBBERY": 0.98,
+    "SHOOTING": 0.11,
+    "THEFTFROMMV": 2.7,
+    "THEFTOVER": 0.54,
+}
+
+# Years in the real crime CSV
+RAW_YEARS = list(range(2014, 2025))
+
+# Areas per chunk of the crime CSV
+CHUNK_ROWS = 50_000
+
+# Rows in the real profile workbook (the rows 03.1 uses, plus "Characteristic N" filler up to this count)
+PROFILE_ROWS = 2603
+
+# One workbook column holds the row labels, the rest one area each
+MAX_PROFILE_AREAS = 16_383
+
 
 #### MAIN FUNCTION ####
 def main():
@@ -95,7 +152,323 @@ def main():
     print(f"Simulated data saved to: data/00-simulated_data/simulated_data.csv")
 
 
+#### Spreadsheet column letters (1 -> A, 27 -> AA, ...) ####
+def column_letters(n_columns: int) -> list[str]:
+    letters = []
+    for number in range(1, n_columns + 1):
+        name = ""
+        while number:
+            number, remainder = divmod(number - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+
+#### Write a one-sheet workbook, streaming one row of cells at a time ####
+# `rows` yields (label, values) pairs: values are a NumPy array (numbers) or a list of strings, one per area.
+# The first row holds "Neighbourhood Name" and the area names, as in the real profile workbook.
+def write_profile_workbook(path: Path, area_names: list[str], rows) -> None:
+    letters = pl.Series(column_letters(len(area_names) + 1))
+
+    # XML of one row: the label in column A, then one cell per area (vectorised with Polars string expressions)
+    def row_xml(number: int, label: str, values) -> str:
+        text = isinstance(values, list)
+        cells = pl.DataFrame({"ref": letters[1:], "value": values}).select(
+            pl.format(
+                (
+                    '<c r="{}{}" t="inlineStr"><is><t>{}</t></is></c>'
+                    if text
+                    else '<c r="{}{}"><v>{}</v></c>'
+                ),
+                "ref",
+                pl.lit(number),
+                (
+                    pl.col("value")
+                    .str.replace_all("&", "&amp;")
+                    .str.replace_all("<", "&lt;")
+                    .str.replace_all(">", "&gt;")
+                    if text
+                    else pl.col("value")
+                ),
+            ).str.join("")
+        )
+        return (
+            f'<row r="{number}"><c r="A{number}" t="inlineStr"><is><t xml:space="preserve">'
+            f"{escape(label)}</t></is></c>{cells.item()}</row>"
+        )
+
+    main_ns = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel_ns = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    package_ns = "http://schemas.openxmlformats.org/package/2006"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr(
+            "[Content_Types].xml",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Types xmlns="{package_ns}/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>',
+        )
+        workbook.writestr(
+            "_rels/.rels",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{package_ns}/relationships">'
+            f'<Relationship Id="rId1" Type="{rel_ns}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        )
+        workbook.writestr(
+            "xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<workbook xmlns="{main_ns}" xmlns:r="{rel_ns}"><sheets>'
+            f'<sheet name="hd2021_census_profile" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        workbook.writestr(
+            "xl/_rels/workbook.xml.rels",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{package_ns}/relationships">'
+            f'<Relationship Id="rId1" Type="{rel_ns}/worksheet" Target="worksheets/sheet1.xml"/></Relationships>',
+        )
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<worksheet xmlns="{main_ns}"><sheetData>'.encode()
+            )
+            sheet.write(row_xml(1, "Neighbourhood Name", area_names).encode())
+            for number, (label, values) in enumerate(rows, start=2):
+                sheet.write(row_xml(number, label, values).encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+
+#### Build a load-testing workspace with synthetic raw data in the real schemas ####
+# Writes DIR/raw/neighbourhood_crime.csv, DIR/raw/neighbourhood_profiles.xlsx and
+# DIR/data/04-reference_data/neighbourhood_index.csv, and creates the folders the pipeline writes to.
+def simulate_raw_data(
+    workspace: str,
+    areas: int = REAL_AREAS,
+    years: list[int] = RAW_YEARS,
+    crimes: list[str] = list(OFFENCE_RATES),
+    seed: int = 838,
+    chunk_rows: int = CHUNK_ROWS,
+) -> None:
+    workspace = Path(workspace)
+    if workspace.resolve() == Path.cwd().resolve():
+        raise ValueError(
+            "Choose a separate workspace folder (the real index would be overwritten)"
+        )
+    if areas > MAX_PROFILE_AREAS:
+        raise ValueError(
+            f"The profile workbook holds at most {MAX_PROFILE_AREAS} areas (Excel column limit), got {areas}"
+        )
+    unknown = [c for c in crimes if c not in OFFENCE_RATES]
+    if unknown:
+        raise ValueError(
+            f"Unknown offences {unknown}; choose from {list(OFFENCE_RATES)}"
+        )
+    print(
+        f"Simulating raw data for {areas} areas, {len(years)} years and {len(crimes)} offences in {workspace}."
+    )
+    for folder in [
+        "raw",
+        "data/00-simulated_data",
+        "data/01-raw_data",
+        "data/02-analysis_data",
+        "data/03-table_data",
+        "data/04-reference_data",
+        "other/figures",
+    ]:
+        (workspace / folder).mkdir(parents=True, exist_ok=True)
+
+    #### Area-level draws (one value per area; small even for millions of areas) ####
+    # [https://numpy.org/doc/stable/reference/random/generator.html#numpy.random.Generator]
+    rng = np.random.default_rng(seed)
+    hood_id = np.arange(1, areas + 1)
+    area_names = [f"Neighbourhood {i}" for i in hood_id]
+    population = rng.integers(low=7700, high=38200, size=areas)  # real min-max
+    # Latent opportunity score: drives both the Census indicators and (inversely) crime
+    opportunity = rng.standard_normal(areas)
+    # Year-to-year drift of each offence (a random walk), shared by all areas
+    year_trend = np.exp(
+        np.cumsum(rng.normal(0, 0.08, size=(len(crimes), len(years))), axis=1)
+    )
+
+    #### Neighbourhood ID index for the synthetic names (see neighbourhoods.py) ####
+    pl.DataFrame(
+        {
+            "spelling": [f"neighbourhood-{i}" for i in hood_id],
+            "neighbourhood_id": hood_id,
+        },
+        schema={"spelling": pl.String, "neighbourhood_id": pl.Int32},
+    ).write_csv(workspace / "data/04-reference_data/neighbourhood_index.csv")
+
+    #### Crime CSV, written in chunks of areas ####
+    crime_path = workspace / "raw/neighbourhood_crime.csv"
+    chunk_starts = range(0, areas, chunk_rows)
+    side = int(np.ceil(np.sqrt(areas)))  # grid of area polygons
+    step = 0.3 / side
+    with open(crime_path, "wb") as crime_file:
+        for chunk, child in zip(chunk_starts, rng.spawn(len(chunk_starts))):
+            rows = slice(chunk, chunk + chunk_rows)
+            n_rows = len(hood_id[rows])
+            columns = {
+                "_id": hood_id[rows],
+                "AREA_NAME": area_names[rows],
+                "HOOD_ID": hood_id[rows],
+            }
+            # Expected incidents = base rate x population x year drift x area effect (low opportunity = more crime)
+            area_effect = np.exp(
+                -0.35 * opportunity[rows, None]
+                + child.normal(0, 0.3, size=(n_rows, len(crimes)))
+            )
+            for c, crime in enumerate(crimes):
+                expected = (
+                    OFFENCE_RATES[crime]
+                    * population[rows, None]
+                    / 1000
+                    * year_trend[c]
+                    * area_effect[:, c, None]
+                )
+                counts = child.poisson(expected)  # (areas x years) in one draw
+                rates = counts / population[rows, None] * 100_000  # per 100K persons
+                columns.update(
+                    {f"{crime}_{y}": counts[:, i] for i, y in enumerate(years)}
+                )
+                columns.update(
+                    {f"{crime}_RATE_{y}": rates[:, i] for i, y in enumerate(years)}
+                )
+            columns[f"POPULATION_{years[-1]}"] = population[rows]
+
+            # A small square polygon per area, laid out on a grid (GeoJSON, as in the real data)
+            lon = -79.6 + (hood_id[rows] % side) * 0.4 / side
+            lat = 43.58 + (hood_id[rows] // side) * 0.27 / side
+            corners = [lon, lat, lon + step, lat, lon + step, lat + step]
+            corners += [lon, lat + step, lon, lat]
+            chunk_df = pl.DataFrame(columns).with_columns(
+                pl.format(
+                    '{"type": "Polygon", "coordinates": [['
+                    + ", ".join(["[{}, {}]"] * 5)
+                    + "]]}",
+                    *[pl.lit(v) for v in corners],
+                ).alias("geometry")
+            )
+            chunk_df.write_csv(crime_file, include_header=chunk == 0)
+    print(f"Crime data saved to: {crime_path}")
+
+    #### Profile workbook (one column per area) ####
+    # Indicators follow the latent opportunity score; counts are consistent with the area population
+    profile_rng = rng.spawn(1)[0]
+    single_parent_share = np.clip(
+        0.18 - 0.05 * opportunity + profile_rng.normal(0, 0.02, areas), 0.05, 0.55
+    )
+    degree_share = np.clip(
+        0.45 + 0.12 * opportunity + profile_rng.normal(0, 0.04, areas), 0.05, 0.95
+    )
+    couple_families = np.round(population * profile_rng.uniform(0.18, 0.26, areas))
+    one_parent = np.round(
+        couple_families * single_parent_share / (1 - single_parent_share)
+    )
+    education_total = np.round(population * profile_rng.uniform(0.5, 0.6, areas))
+    labelled_rows = [
+        ("Neighbourhood Number", hood_id),
+        (
+            "TSNS 2020 Designation",
+            np.where(
+                opportunity < -1,
+                "Neighbourhood Improvement Area",
+                "Not an NIA or Emerging Neighbourhood",
+            ).tolist(),
+        ),
+        ("Total - Persons in private households - 25% sample data", population),
+        ("  Couple-family households", couple_families),
+        ("  One-parent-family households", one_parent),
+        (
+            "Median total income of household in 2020 ($)",
+            np.round(
+                95_000 * np.exp(0.3 * opportunity + profile_rng.normal(0, 0.1, areas)),
+                -3,
+            ),
+        ),
+        # Bachelor's degree row of the 15+ population (03.1 keeps the later, 25-64 one)
+        (
+            "      Bachelor's degree or higher",
+            np.round(population * 0.8 * degree_share * 0.9),
+        ),
+        (
+            "Unemployment rate",
+            np.clip(
+                10 - 2.5 * opportunity + profile_rng.normal(0, 1, areas), 2, 30
+            ).round(1),
+        ),
+        (
+            "Total - Highest certificate, diploma or degree for the population aged 25 to 64 years in private households - 25% sample data",
+            education_total,
+        ),
+        ("      Bachelor's degree or higher", np.round(education_total * degree_share)),
+    ]
+
+    # Filler characteristics, drawn one row at a time while the workbook is written
+    def profile_rows():
+        yield from labelled_rows
+        for i in range(1, PROFILE_ROWS - len(labelled_rows) + 1):
+            yield f"Characteristic {i}", profile_rng.integers(0, 5000, size=areas)
+
+    profile_path = workspace / "raw/neighbourhood_profiles.xlsx"
+    write_profile_workbook(profile_path, area_names, profile_rows())
+    print(f"Profile data saved to: {profile_path}")
+
+
+#### Parse "FIRST-LAST" (or a single year) into a list of years ####
+def year_range(text: str) -> list[int]:
+    first, _, last = text.partition("-")
+    return list(range(int(first), int(last or first) + 1))
+
+
 #### ENTRY POINT ####
 if __name__ == "__main__":
-    main()
-    print("Simulation complete.")
+    parser = argparse.ArgumentParser(description="Simulate the crime/profile data.")
+    parser.add_argument(
+        "--raw",
+        metavar="DIR",
+        default=None,
+        help="build a load-testing workspace of raw inputs in DIR instead of the simulated test dataset",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="number of areas as a multiple of Toronto's 158 neighbourhoods (default: 1)",
+    )
+    parser.add_argument(
+        "--areas", type=int, default=None, help="number of areas (overrides --scale)"
+    )
+    parser.add_argument(
+        "--years",
+        type=year_range,
+        default=RAW_YEARS,
+        help="year range, e.g., 2014-2024 (default)",
+    )
+    parser.add_argument(
+        "--crimes",
+        nargs="+",
+        default=list(OFFENCE_RATES),
+        help="offences to include (default: all nine in the real data)",
+    )
+    parser.add_argument("--seed", type=int, default=838, help="random seed")
+    args = parser.parse_args()
+
+    if args.raw is None:
+        main()
+        print("Simulation complete.")
+    else:
+        try:
+            simulate_raw_data(
+                args.raw,
+                areas=args.areas or round(REAL_AREAS * args.scale),
+                years=args.years,
+                crimes=args.crimes,
+                seed=args.seed,
+            )
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+        print("Raw data simulation complete.")
@@ -6,9 +6,173 @@
 # License: MIT
 # Pre-requisites:
 # - `requests` must be installed (pip install requests)
+# Notes:
+# - All `package_show` calls, then all matching resources, are fetched concurrently over one pooled session.
+# - Resources are streamed to disk in chunks and renamed into place when complete (never held in memory).
+# - .cache/pipeline/http_cache.json remembers each resource's CKAN `last_modified` and HTTP validators
+#   (ETag / Last-Modified). Unchanged resources are not requested at all; otherwise the request is conditional
+#   and a "304 Not Modified" keeps the file on disk. Delete the JSON file to force a full re-download.
+# - Every matching resource is saved to its own file: the last one (the one the original script kept, as each
+#   match overwrote the file) to the file the cleaning scripts read (e.g., neighbourhood_crime.csv), any others
+#   to "<name>_<resource name>.<ext>" next to it.
+# - A failed download does not lose the others: every finished download is recorded in the HTTP cache before the
+#   first error is raised.
+# - The CKAN_BASE_URL environment variable overrides the Open Data Toronto URL (see ckan_fixture_server.py).
+# References:
+# - [https://requests.readthedocs.io/en/latest/user/advanced/#session-objects]
+# - [https://docs.python.org/3/library/concurrent.futures.html#threadpoolexecutor]
+# - [https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests]
 
 #### Workspace setup ####
+import json  # inherent to Python
+import os  # inherent to Python
+import re  # inherent to Python
+from concurrent.futures import ThreadPoolExecutor, as_completed  # inherent to Python
+from pathlib import Path  # inherent to Python
+
 import requests
+from requests.adapters import HTTPAdapter
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = []
+OUTPUTS = [
+    "data/01-raw_data/neighbourhood_crime.csv",
+    "data/01-raw_data/neighbourhood_profiles.xlsx",
+]
+# Always run (the HTTP cache below decides what actually needs downloading)
+ALWAYS_RUN = True
+
+# Resource metadata and HTTP validators from the last run
+HTTP_CACHE = Path(".cache/pipeline/http_cache.json")  # per machine, so ignored by git
+
+# Maximum number of simultaneous HTTP requests (also the size of the connection pool)
+MAX_WORKERS = 8
+
+# Bytes read from the network and written to disk at a time
+CHUNK_SIZE = 1024 * 1024
+
+
+#### Which resources to download from each package, and where to save them ####
+# To get all records in CSV format (datastore_active resources are dumped from the CKAN datastore):
+def is_crime_resource(resource: dict) -> bool:
+    return resource["datastore_active"]
+
+
+# To get all records in XLSX format:
+def is_profile_resource(resource: dict) -> bool:
+    return resource.get("format", "").lower() == "xlsx"
+
+
+PACKAGES = {
+    "neighbourhood-crime-rates": (
+        is_crime_resource,
+        Path("data/01-raw_data/neighbourhood_crime.csv"),
+    ),
+    "neighbourhood-profiles": (
+        is_profile_resource,
+        Path("data/01-raw_data/neighbourhood_profiles.xlsx"),
+    ),
+}
+
+
+#### Create one session whose connection pool is shared by all download threads ####
+# [https://requests.readthedocs.io/en/latest/api/#requests.adapters.HTTPAdapter]
+def make_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+#### Get a package's metadata (its list of resources) ####
+def fetch_package(session: requests.Session, base_url: str, package_id: str) -> dict:
+    url = base_url + "/api/3/action/package_show"
+    response = session.get(url, params={"id": package_id})
+    response.raise_for_status()
+    return response.json()["result"]
+
+
+#### Load / save the HTTP cache ({target file: cache entry}) ####
+def load_http_cache() -> dict:
+    if HTTP_CACHE.exists():
+        return json.loads(HTTP_CACHE.read_text())
+    return {}
+
+
+def save_http_cache(cache: dict):
+    HTTP_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    partial = HTTP_CACHE.with_name(HTTP_CACHE.name + ".part")
+    partial.write_text(json.dumps(cache, indent=2, sort_keys=True))
+    os.replace(partial, HTTP_CACHE)
+
+
+#### Is the file on disk still the current version of the resource (per its CKAN metadata)? ####
+def is_unchanged(resource: dict, target: Path, cached: dict | None) -> bool:
+    return (
+        cached is not None
+        and target.exists()
+        and cached["resource_id"] == resource["id"]
+        and resource.get("last_modified") is not None
+        and cached["last_modified"] == resource["last_modified"]
+    )
+
+
+#### Download one resource, streaming it to disk ####
+# If the file was downloaded before, the request carries its validators (If-None-Match / If-Modified-Since),
+# and a "304 Not Modified" response leaves the file as it is.
+# The body is written in CHUNK_SIZE pieces to "<target>.part" in the same folder, which is renamed over the
+# target only once complete: memory use stays flat however large the dump is, and an interrupted download
+# never leaves a half-written file behind.
+# [https://requests.readthedocs.io/en/latest/user/advanced/#body-content-workflow]
+# Returns the HTTP validators to remember and whether the file was re-downloaded.
+def download_resource(
+    session: requests.Session, url: str, target: Path, cached: dict | None
+) -> tuple[dict, bool]:
+    headers = {}
+    if cached is not None and target.exists():
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("http_last_modified"):
+            headers["If-Modified-Since"] = cached["http_last_modified"]
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(target.name + ".part")
+    with session.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return cached, False
+        response.raise_for_status()
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "http_last_modified": response.headers.get("Last-Modified"),
+        }
+        #### Save bytes data to file ####
+        # [https://docs.python.org/3/library/functions.html#open]
+        try:
+            with open(partial, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            partial.unlink(missing_ok=True)  # don't leave a half-written file behind
+            raise
+    os.replace(partial, target)  # atomic rename
+    return validators, True
+
+
+#### Resource URL (datastore dump for datastore_active resources, the file URL otherwise) ####
+def resource_url(base_url: str, resource: dict) -> str:
+    if resource["datastore_active"]:
+        return base_url + "/datastore/dump/" + resource["id"]
+    return resource["url"]
+
+
+#### Target file for a matching resource of a package ####
+# The package's last matching resource is the one the cleaning scripts read (`last` = True).
+def resource_target(target: Path, resource: dict, last: bool) -> Path:
+    if last:
+        return target  # the file the cleaning scripts read
+    slug = re.sub(r"[^a-z0-9]+", "-", resource["name"].lower()).strip("-")
+    return target.with_name(f"{target.stem}_{slug}{target.suffix}")
 
 
 #### MAIN FUNCTION ####
@@ -21,44 +185,69 @@ def main():
     # [https://docs.ckan.org/en/latest/api/]
 
     # To hit our API, you'll be making requests to:
-    base_url = "https://ckan0.cf.opendata.inter.prod-toronto.ca"
+    # (set CKAN_BASE_URL to use another CKAN instance, e.g., scripts/ckan_fixture_server.py for offline runs)
+    base_url = os.environ.get(
+        "CKAN_BASE_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca"
+    ).rstrip("/")
 
-    # Datasets are called "packages". Each package can contain many "resources"
-    # To retrieve the metadata for this package and its resources, use the package name in this page's URL:
-    url = base_url + "/api/3/action/package_show"
+    with make_session() as session, ThreadPoolExecutor(MAX_WORKERS) as executor:
+        # Datasets are called "packages". Each package can contain many "resources"
+        # Retrieve the metadata of every package at once
+        packages = dict(
+            zip(
+                PACKAGES,
+                executor.map(
+                    lambda package_id: fetch_package(session, base_url, package_id),
+                    PACKAGES,
+                ),
+            )
+        )
+
+        # Queue every matching resource of every package, each to its own file
+        # (unless its CKAN metadata shows it hasn't changed since the last download)
+        http_cache = load_http_cache()
+        downloads = {}  # future -> (target, resource)
+        for package_id, (matches, target) in PACKAGES.items():
+            resources = [r for r in packages[package_id]["resources"] if matches(r)]
+            for n, resource in enumerate(resources):
+                resource_file = resource_target(
+                    target, resource, last=n == len(resources) - 1
+                )
+                cached = http_cache.get(str(resource_file))
+                if is_unchanged(resource, resource_file, cached):
+                    print(f"Unchanged: {resource_file}")
+                    continue
+                download = executor.submit(
+                    download_resource,
+                    session,
+                    resource_url(base_url, resource),
+                    resource_file,
+                    cached,
+                )
+                downloads[download] = (resource_file, resource)
 
-    # Crime package
-    params_crime = {"id": "neighbourhood-crime-rates"}
-    package_crime = requests.get(url, params=params_crime).json()
-
-    # Profile package
-    params_profile = {"id": "neighbourhood-profiles"}
-    package_profile = requests.get(url, params=params_profile).json()
-
-    # To get resource data for crime:
-    for c_idx, c_resource in enumerate(package_crime["result"]["resources"]):
-        # for datastore_active resources:
-        if c_resource["datastore_active"]:
-            # To get all records in CSV format:
-            c_url = base_url + "/datastore/dump/" + c_resource["id"]
-            c_resource_dump_data = requests.get(c_url).text
-            #### Save string data to CSV file ####
-            # [https://docs.python.org/3/library/functions.html#open]
-            with open(
-                "data/01-raw_data/neighbourhood_crime.csv", "w", encoding="utf-8"
-            ) as f:
-                f.write(c_resource_dump_data)
-
-    # To get resource data for profiles:
-    for p_idx, p_resource in enumerate(package_profile["result"]["resources"]):
-        # To get all records in XLSX format:
-        if p_resource.get("format", "").lower() == "xlsx":
-            p_url = p_resource["url"]
-            p_resource_dump_data = requests.get(p_url).content
-            #### Save bytes data to XLSX file ####
-            # [https://docs.python.org/3/library/functions.html#open]
-            with open("data/01-raw_data/neighbourhood_profiles.xlsx", "wb") as f:
-                f.write(p_resource_dump_data)
+        # Remember every download as it finishes; the cache is saved even if one failed (files already renamed
+        # into place keep their validators), then the first error is raised
+        errors = []
+        try:
+            for download in as_completed(downloads):
+                resource_file, resource = downloads[download]
+                try:
+                    validators, downloaded = download.result()
+                except Exception as error:
+                    print(f"Failed: {resource_file} ({error})")
+                    errors.append(error)
+                    continue
+                print(f"{'Saved' if downloaded else 'Not modified'}: {resource_file}")
+                http_cache[str(resource_file)] = {
+                    **validators,
+                    "resource_id": resource["id"],
+                    "last_modified": resource.get("last_modified"),
+                }
+        finally:
+            save_http_cache(http_cache)
+        if errors:
+            raise errors[0]
 
 
 #### ENTRY POINT ####
@@ -0,0 +1,140 @@
+#### Preamble ####
+# Purpose: Tests the download script end to end against the offline CKAN stand-in (no network needed).
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `requests` must be installed (pip install requests)
+# - `pytest` must be installed (pip install pytest); run with "pytest -q" from the project root
+# References:
+# - [https://docs.pytest.org/en/stable/how-to/monkeypatch.html]
+
+#### Workspace setup ####
+import contextlib  # inherent to Python
+import importlib.util  # for loading the prefix-numbered download script
+import json  # inherent to Python
+import shutil  # inherent to Python
+import threading  # for running the fixture server alongside the test
+from pathlib import Path
+
+import pytest  # test functions across any .py ending with "test"
+
+import ckan_fixture_server
+from ckan_fixture_server import make_server
+
+RAW_DATA = Path("data/01-raw_data").resolve()
+RAW_FILES = ["neighbourhood_crime.csv", "neighbourhood_profiles.xlsx"]
+
+
+#### Test data ####
+# Serve a data folder on a free local port (yields the server's URL)
+@contextlib.contextmanager
+def serve(data_dir: Path):
+    server = make_server(data_dir, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Serve the checked-in raw data
+@pytest.fixture
+def ckan_url():
+    with serve(RAW_DATA) as url:
+        yield url
+
+
+# Load 02.0-download_data.py as a module (its name starts with a digit)
+@pytest.fixture
+def download_script():
+    path = Path(__file__).parent / "02.0-download_data.py"
+    spec = importlib.util.spec_from_file_location("download_data", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Check that every served file is downloaded byte for byte (into a temporary project folder)
+def test_download_matches_fixture(ckan_url, download_script, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CKAN_BASE_URL", ckan_url)
+    download_script.main()
+    for name in RAW_FILES:
+        downloaded = tmp_path / "data/01-raw_data" / name
+        assert (
+            downloaded.read_bytes() == (RAW_DATA / name).read_bytes()
+        ), f"{name} differs from the served file"
+
+
+# Check that a second run downloads nothing (the HTTP cache sees unchanged resources)
+def test_second_download_is_skipped(
+    ckan_url, download_script, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CKAN_BASE_URL", ckan_url)
+    download_script.main()
+    capsys.readouterr()
+    download_script.main()
+    assert (
+        "Saved" not in capsys.readouterr().out
+    ), "Unchanged files were downloaded again"
+
+
+# Check that a failed download does not lose the validators of the downloads that finished
+def test_failed_download_keeps_finished_ones(
+    ckan_url, download_script, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CKAN_BASE_URL", ckan_url)
+    download_resource = download_script.download_resource
+
+    def fail_on_profiles(session, url, target, cached):
+        if target.suffix == ".xlsx":
+            raise OSError("simulated failure")
+        return download_resource(session, url, target, cached)
+
+    monkeypatch.setattr(download_script, "download_resource", fail_on_profiles)
+    with pytest.raises(OSError, match="simulated failure"):
+        download_script.main()
+    http_cache = json.loads(download_script.HTTP_CACHE.read_text())
+    assert list(http_cache) == [
+        "data/01-raw_data/neighbourhood_crime.csv"
+    ], "The finished download was not recorded"
+
+
+# Check that with several matching resources, the last one (as before) is saved to the file the cleaning reads
+def test_last_matching_resource_is_main_file(download_script, tmp_path, monkeypatch):
+    data_dir = tmp_path / "served"
+    data_dir.mkdir()
+    for name in RAW_FILES:
+        shutil.copy(RAW_DATA / name, data_dir / name)
+    (data_dir / "older_profiles.xlsx").write_bytes(b"older workbook")
+    older = {
+        "id": "neighbourhood-profiles-2016",
+        "name": "neighbourhood-profiles-2016-140-model",
+        "format": "XLSX",
+        "datastore_active": False,
+        "file": "older_profiles.xlsx",
+    }
+    monkeypatch.setitem(
+        ckan_fixture_server.FIXTURES,
+        "neighbourhood-profiles",
+        [older, *ckan_fixture_server.FIXTURES["neighbourhood-profiles"]],
+    )
+    project = tmp_path / "project"
+    project.mkdir()
+    monkeypatch.chdir(project)
+    with serve(data_dir) as url:
+        monkeypatch.setenv("CKAN_BASE_URL", url)
+        download_script.main()
+    raw = project / "data/01-raw_data"
+    assert (raw / "neighbourhood_profiles.xlsx").read_bytes() == (
+        RAW_DATA / "neighbourhood_profiles.xlsx"
+    ).read_bytes(), "The main file is not the last matching resource"
+    assert (
+        raw / "neighbourhood_profiles_neighbourhood-profiles-2016-140-model.xlsx"
+    ).read_bytes() == b"older workbook"
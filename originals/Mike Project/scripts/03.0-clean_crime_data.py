@@ -6,22 +6,49 @@
 # License: MIT
 # Pre-requisites:
 # - `polars` must be installed (pip install polars)
+# Notes:
+# - The raw CSV is scanned lazily: the select, renames, text normalisation and null filling below form one query
+#   plan, and only the selected columns are parsed (the other offences, years and geometry are skipped).
+# References:
+# - [https://docs.pola.rs/user-guide/lazy/optimizations/]
 
 #### Workspace setup ####
 import polars as pl
 
+from neighbourhoods import (
+    NEIGHBOURHOOD_INDEX,
+    with_neighbourhood_id,
+)  # shared name canonicaliser and neighbourhood ID index
+from pipeline_io import (
+    write_table,
+    table_path,
+)  # shared table writer (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+CRIME_TABLE = table_path("data/02-analysis_data/00-analysis_data_crime")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    "data/01-raw_data/neighbourhood_crime.csv",
+    NEIGHBOURHOOD_INDEX,
+]
+OUTPUTS = [
+    CRIME_TABLE,
+]
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Cleaning neighbourhood crime data.")
 
     #### 03.0-clean_crime_data.py ####
     #### Load and clean neighbourhood crime data ####
-    # Neighbourhood crime data
-    crime_df = pl.read_csv("data/01-raw_data/neighbourhood_crime.csv")
+    # Neighbourhood crime data (a LazyFrame: nothing is read until .collect() below)
+    # [https://docs.pola.rs/api/python/stable/reference/api/polars.scan_csv.html]
+    crime_df = pl.scan_csv("data/01-raw_data/neighbourhood_crime.csv")
 
-    # Select columns of interest
-    # [https://docs.pola.rs/api/python/stable/reference/dataframe/api/polars.DataFrame.select.html#polars.DataFrame.select]
+    # Select columns of interest (projection pushdown: only these columns are parsed)
+    # [https://docs.pola.rs/api/python/stable/reference/lazyframe/api/polars.LazyFrame.select.html]
     crime_df = crime_df.select(
         "AREA_NAME",  # neighbourhoods
         "ASSAULT_2019",
@@ -89,20 +116,12 @@ def main():
     # Rename neighbourhood column
     clean_df = crime_df.rename({"AREA_NAME": "neighbourhood"})
 
-    # Normalize the text in neighbourhood so it matches the profile side
-    clean_df = clean_df.with_columns(
-        pl.col("neighbourhood")
-        .str.normalize(form="NFKC")
-        .str.strip_chars(" ")  # strip leading/trailing spaces
-        .str.replace_all("`", "'")  # standardize apostrophes
-        .str.replace_all(r"\s+", "-")  # spaces become dashes
-        .str.replace_all(r"\.", "")  # drop every period
-        .str.replace_all(r"\s+", "-")  # space become dashes again
-        .str.to_lowercase()  # lowercase
-    )
+    # Canonicalise the neighbourhood names and add their integer neighbourhood_id (the join key in 04.0)
+    clean_df = with_neighbourhood_id(clean_df, "neighbourhood")
 
     # Fill missing values in the rate columns with 0.0
-    rate_cols = [c for c in clean_df.columns if "_RATE_" in c]
+    # (collect_schema() resolves the column names without reading any data)
+    rate_cols = [c for c in clean_df.collect_schema().names() if "_RATE_" in c]
     clean_df = clean_df.with_columns(
         [
             pl.col(c).fill_null(0.0).alias(c) for c in rate_cols
@@ -110,15 +129,18 @@ def main():
     )
 
     # Lowercase all column names so joins/tests don't break later
-    clean_df = clean_df.rename({c: c.lower() for c in clean_df.columns})
+    clean_df = clean_df.rename(
+        {c: c.lower() for c in clean_df.collect_schema().names()}
+    )
+
+    # Run the optimised query plan
+    clean_df = clean_df.collect()
 
     #### Save data ####
-    clean_df.write_csv("data/02-analysis_data/00-analysis_data_crime.csv")
+    write_table(clean_df, CRIME_TABLE, artifacts)
 
 
 #### ENTRY POINT ####
 if __name__ == "__main__":
     main()
-    print(
-        "Neighbourhood crime data cleaned and saved to: data/02-analysis_data/00-analysis_data_crime.csv"
-    )
+    print(f"Neighbourhood crime data cleaned and saved to: {CRIME_TABLE}")
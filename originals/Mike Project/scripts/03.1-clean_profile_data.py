@@ -6,19 +6,44 @@
 # License: MIT
 # Pre-requisites:
 # - `polars` must be installed (pip install polars)
+# Notes:
+# - The workbook is parsed from Excel only the first time (or after it changes); later runs scan a cached
+#   Parquet copy and only materialise the rows kept below (see scan_excel_cached in pipeline_io.py).
 
 #### Workspace setup ####
 import polars as pl
 
+from neighbourhoods import (
+    NEIGHBOURHOOD_INDEX,
+    with_neighbourhood_id,
+)  # shared name canonicaliser and neighbourhood ID index
+from pipeline_io import (
+    scan_excel_cached,
+    write_table,
+    table_path,
+)  # shared table writer (CSV/Parquet/IPC or in-memory) and cached Excel reader
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+PROFILE_TABLE = table_path("data/02-analysis_data/01-analysis_data_profiles")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    "data/01-raw_data/neighbourhood_profiles.xlsx",
+    NEIGHBOURHOOD_INDEX,
+]
+OUTPUTS = [
+    PROFILE_TABLE,
+]
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Cleaning neighbourhood profile data.")
 
     #### 03.1-clean_profile_data.py ####
     #### Load and clean neighbourhood profile data ####
-    # Neighbourhood profile data
-    profile_df = pl.read_excel("data/01-raw_data/neighbourhood_profiles.xlsx")
+    # Neighbourhood profile data (lazily, from the cached Parquet copy of the workbook)
+    profile_df = scan_excel_cached("data/01-raw_data/neighbourhood_profiles.xlsx")
 
     # Unicode normalization, strip whitespace and replace a problem apostrophe (in Neighbourhood Name)
     # [https://sparkbyexamples.com/polars/strip-entire-polars-dataframe]
@@ -48,6 +73,9 @@ def main():
         # [https://docs.pola.rs/api/python/stable/reference/dataframe/api/polars.DataFrame.unique.html]
     ).unique(subset="Neighbourhood Name", keep="last", maintain_order=True)
 
+    # Run the query: only the rows kept above are materialised
+    profile_filter = profile_filter.collect()
+
     # Need to flip the spreadsheet to merge (transpose: rows become columns and vice versa)
     # [https://sparkbyexamples.com/polars/polars-transpose-dataframe/]
     profile_transposed = profile_filter.transpose(
@@ -100,26 +128,11 @@ def main():
     # Lowercase all column names so joins/tests don't break later
     profile_clean = profile_clean.rename({c: c.lower() for c in profile_clean.columns})
 
-    # Normalize the text in neighbourhood so it matches the crime side
-    profile_clean = profile_clean.with_columns(
-        pl.col("neighbourhood")
-        .str.normalize(form="NFKC")
-        .str.strip_chars(" ")  # strip leading/trailing spaces
-        .str.replace_all("`", "'")  # standardize apostrophes
-        .str.replace_all(r"\s+", "-")  # spaces become dashes
-        .str.replace_all(r"\.", "")  # drop every period
-        .str.replace_all(r"\s+", "-")  # space become dashes again
-        .str.to_lowercase()  # lowercase
-        # Manually adjust specific neighbourhoods (see below)
-        .str.replace_all(r"st-james", "stjames")
-        .str.replace_all(r"st-clair", "stclair")
-        .str.replace_all(
-            r"cabbagetown-south-st-james-town", "cabbagetown-south-stjames-town"
-        )
-    )
+    # Canonicalise the neighbourhood names and add their integer neighbourhood_id (the join key in 04.0)
+    profile_clean = with_neighbourhood_id(profile_clean, "neighbourhood")
 
     #### Save data ####
-    profile_clean.write_csv("data/02-analysis_data/01-analysis_data_profiles.csv")
+    write_table(profile_clean, PROFILE_TABLE, artifacts)
 
 
 #### ENTRY POINT ####
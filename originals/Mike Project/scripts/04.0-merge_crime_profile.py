@@ -6,34 +6,140 @@
 # License: MIT
 # Pre-requisites:
 # - `polars` must be installed (pip install polars)
+# Notes:
+# - Rows whose spelling is not in the neighbourhood ID index are fuzzy matched against the other table's names
+#   (see match_names in neighbourhoods.py). Every match is kept in data/04-reference_data/neighbourhood_matches.csv;
+#   only rows with accepted=true are used (set automatically when score >= MIN_MATCH_SCORE). Review the file and
+#   flip `accepted` (or correct `neighbourhood_id`) as needed: names already in the file are never re-matched.
+# - Matching is one-to-one: a name is only matched to IDs its own table does not already use, and a match is not
+#   accepted if it would give the table a second spelling of an ID (the left join would then duplicate rows).
 
 #### Workspace setup ####
 import polars as pl
 import functools  # inherent to Python
 import operator  # inherent to Python
+import os  # inherent to Python
+
+from neighbourhoods import (
+    MATCHES_SCHEMA,
+    MIN_MATCH_SCORE,
+    NEIGHBOURHOOD_MATCHES,
+    match_names,
+)  # fuzzy matching of neighbourhood spellings missing from the ID index
+from pipeline_io import (
+    read_table,
+    write_table,
+    table_path,
+)  # shared table I/O (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+CRIME_TABLE = table_path("data/02-analysis_data/00-analysis_data_crime")
+PROFILE_TABLE = table_path("data/02-analysis_data/01-analysis_data_profiles")
+MERGED_TABLE = table_path("data/02-analysis_data/02-analysis_data_merged")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    CRIME_TABLE,
+    PROFILE_TABLE,
+    NEIGHBOURHOOD_MATCHES,
+]
+OUTPUTS = [
+    MERGED_TABLE,
+    NEIGHBOURHOOD_MATCHES,
+]
+
+
+#### Fill in missing neighbourhood IDs from accepted fuzzy matches against the other table ####
+# Spellings not yet in `matches` are matched and added to it; returns the updated DataFrame and matches.
+# Only IDs that `df` does not already use are candidates, and accepted matches that would still give `df` a
+# second spelling of an ID (e.g., two spellings matched to one ID) are set to accepted=false for review.
+def resolve_unmatched(
+    df: pl.DataFrame, other: pl.DataFrame, matches: pl.DataFrame
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    unmatched = df.filter(pl.col("neighbourhood_id").is_null())[
+        "neighbourhood"
+    ].unique()
+    used_ids = df["neighbourhood_id"].drop_nulls().unique()
+    new = unmatched.filter(~unmatched.is_in(matches["spelling"].implode()))
+    if new.len():
+        candidates = other.filter(
+            pl.col("neighbourhood_id").is_not_null()
+            & ~pl.col("neighbourhood_id").is_in(used_ids.implode())
+        ).select(pl.col("neighbourhood").alias("spelling"), "neighbourhood_id")
+        found = match_names(new.to_list(), candidates).with_columns(
+            (pl.col("score") >= MIN_MATCH_SCORE).alias("accepted")
+        )
+        matches = pl.concat(
+            [
+                matches,
+                found.select(pl.col(c).cast(t) for c, t in MATCHES_SCHEMA.items()),
+            ]
+        )
+
+    # One spelling per ID: revoke accepted matches of this table's spellings to a used or shared ID
+    claims = pl.col("spelling").is_in(unmatched.implode()) & pl.col("accepted")
+    conflict = pl.col("neighbourhood_id").is_in(used_ids.implode()) | (
+        claims.sum().over("neighbourhood_id") > 1
+    )
+    matches = matches.with_columns(
+        (pl.col("accepted") & ~(claims & conflict.fill_null(False))).alias("accepted")
+    )
+
+    accepted = matches.filter("accepted").select(
+        pl.col("spelling").alias("neighbourhood"),
+        pl.col("neighbourhood_id").alias("matched_id"),
+    )
+    df = (
+        df.join(accepted, on="neighbourhood", how="left")
+        .with_columns(
+            pl.coalesce("neighbourhood_id", "matched_id").alias("neighbourhood_id")
+        )
+        .drop("matched_id")
+    )
+    return df, matches
 
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Merging neighbourhood crime and profile data.")
 
     #### 04.0-merge_crime_profile.py ####
     #### Load and merge neighbourhood crime and profile data ####
-    crime_df = pl.read_csv("data/02-analysis_data/00-analysis_data_crime.csv")
-    profile_df = pl.read_csv("data/02-analysis_data/01-analysis_data_profiles.csv")
+    crime_df = read_table(CRIME_TABLE, artifacts)
+    profile_df = read_table(PROFILE_TABLE, artifacts)
+
+    # Resolve spellings missing from the ID index (each side against the other's names)
+    if os.path.exists(NEIGHBOURHOOD_MATCHES):
+        matches = pl.read_csv(NEIGHBOURHOOD_MATCHES, schema=MATCHES_SCHEMA)
+    else:
+        matches = pl.DataFrame(schema=MATCHES_SCHEMA)
+    crime_df, matches = resolve_unmatched(crime_df, profile_df, matches)
+    profile_df, matches = resolve_unmatched(profile_df, crime_df, matches)
+    for row in matches.filter(~pl.col("accepted")).iter_rows(named=True):
+        print(
+            f"Unaccepted match (review {NEIGHBOURHOOD_MATCHES}): "
+            f"{row['spelling']} -> {row['matched_spelling']} (score {row['score']:.2f})"
+        )
 
-    # Anti-join to identify any name mismatches; "which crime names do not appear in profile_df?"
+    # Anti-join to identify any mismatches; "which crime neighbourhoods do not appear in profile_df?"
+    # (names were mapped to IDs in 03.0 / 03.1; see neighbourhoods.py)
     # [https://docs.pola.rs/user-guide/transformations/joins/#semi-join]
-    mismatches = crime_df.join(profile_df, on="neighbourhood", how="anti")
+    mismatches = crime_df.join(profile_df, on="neighbourhood_id", how="anti")
     print(mismatches.select("neighbourhood").unique().to_series().to_list())
 
-    # Merge the two DFs on the neighbourhood column
+    # Merge the two DFs on the integer neighbourhood ID (the crime side's name is kept)
     # [https://dataguymichael.substack.com/p/the-ultimate-polars-cheat-sheet-for]
     merged_df = crime_df.join(
-        profile_df,
-        on="neighbourhood",
+        profile_df.drop("neighbourhood"),
+        on="neighbourhood_id",
         how="left",  # keep rows from right dataframe (profile_df)
     )
+    # One profile per crime row; a repeated neighbourhood_id in the profile data would duplicate rows
+    if merged_df.height != crime_df.height:
+        raise ValueError(
+            f"Merging duplicated crime rows ({crime_df.height} -> {merged_df.height}); "
+            f"check neighbourhood_id in {NEIGHBOURHOOD_MATCHES}"
+        )
 
     # Reorder columns via select (recommended method for polars); one-parent-family households first, then two-parent families, etc.
     # [https://stackoverflow.com/questions/71353113/polars-how-to-reorder-columns-in-a-specific-order]
@@ -115,7 +221,12 @@ def main():
     )
 
     #### Save data ####
-    clean_df.write_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    write_table(clean_df, MERGED_TABLE, artifacts)
+
+    # Save the fuzzy matches for review and later runs (temporary file, then rename)
+    temp_path = NEIGHBOURHOOD_MATCHES + ".tmp"
+    matches.sort("spelling").write_csv(temp_path)
+    os.replace(temp_path, NEIGHBOURHOOD_MATCHES)
 
 
 #### ENTRY POINT ####
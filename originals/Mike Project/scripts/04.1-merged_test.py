@@ -11,15 +11,68 @@
 # - [https://docs.pytest.org/en/stable]
 
 #### Workspace setup ####
+import importlib.util  # for loading the prefix-numbered merge script
+from pathlib import Path  # inherent to Python
+
 import polars as pl
 import pytest  # test functions across any .py ending with "test"
 
+from pipeline_io import read_table, table_path  # reader matching PIPELINE_FORMAT
+
 
 #### Test data ####
-# Test if data loads correctly (uses fixture function to try to read 02-analysis_data_merged.csv)
+# Test if data loads correctly (uses fixture function to try to read 02-analysis_data_merged in PIPELINE_FORMAT)
 @pytest.fixture
 def merged_data():
-    return pl.read_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    return read_table(table_path("data/02-analysis_data/02-analysis_data_merged"))
+
+
+# Load 04.0-merge_crime_profile.py as a module (its name starts with a digit)
+@pytest.fixture
+def merge_script():
+    path = Path(__file__).parent / "04.0-merge_crime_profile.py"
+    spec = importlib.util.spec_from_file_location("merge_crime_profile", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# A table of canonical neighbourhood names and their IDs (null = not in the index)
+def names(spellings: dict) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "neighbourhood": list(spellings),
+            "neighbourhood_id": list(spellings.values()),
+        },
+        schema={"neighbourhood": pl.String, "neighbourhood_id": pl.Int32},
+    )
+
+
+# Check that a spelling is not matched to an ID its own table already uses (the join would duplicate rows)
+def test_match_skips_used_ids(merge_script):
+    crime_df = names({"mount-pleasant-east": 1})
+    profile_df = names({"mount-pleasant-east": 1, "mount-pleasant-east-(99)": None})
+    matches = pl.DataFrame(schema=merge_script.MATCHES_SCHEMA)
+    profile_df, matches = merge_script.resolve_unmatched(profile_df, crime_df, matches)
+    assert (
+        profile_df["neighbourhood_id"].drop_nulls().is_unique().all()
+    ), "Two profile spellings share a neighbourhood_id"
+    merged = crime_df.join(
+        profile_df.drop("neighbourhood"), on="neighbourhood_id", how="left"
+    )
+    assert merged.height == crime_df.height, "The merge duplicated crime rows"
+
+
+# Check that two spellings matched to the same ID are both left unaccepted (for review)
+def test_shared_match_is_not_accepted(merge_script):
+    crime_df = names({"mount-pleasant-east": 1})
+    profile_df = names(
+        {"mount-pleasant-east-(99)": None, "mount-pleasant-east-(98)": None}
+    )
+    matches = pl.DataFrame(schema=merge_script.MATCHES_SCHEMA)
+    profile_df, matches = merge_script.resolve_unmatched(profile_df, crime_df, matches)
+    assert matches.height == 2 and not matches["accepted"].any(), matches
+    assert profile_df["neighbourhood_id"].null_count() == 2
 
 
 # Check that the dataset has 158 rows (there are 158 neighbourhoods in Toronto; height in polars)
@@ -9,13 +9,26 @@
 # - `numpy` must be installed (pip install numpy)
 # - `matplotlib` must be installed (pip install matplotlib)
 # - `scikit-learn` must be installed (pip install scikit-learn)
+# - `joblib` must be installed (installed with scikit-learn)
+# Notes:
+# - The candidate K values are fitted in parallel (one joblib worker each), and the fitted model for the K used
+#   in the analysis (PARAMS["n_clusters"]) is reused rather than refitted.
+# - Silhouette scores are O(n²): with more rows than PARAMS["silhouette_sample_size"], each score is computed
+#   on a random sample of that many rows (the 158 Toronto neighbourhoods are always scored in full).
+# - With CLUSTER_ENGINE=minibatch (or "--engine minibatch" in 00.0-run_pipeline.py), the features are streamed
+#   from the merged table in chunks and clustered with MiniBatchKMeans instead (see clustering.py). The merged
+#   table is never loaded whole in that mode: the labels are joined onto a lazy scan of it by row position and
+#   the result is streamed back to disk (sink_table in pipeline_io.py).
+# - Clusters are numbered by opportunity (0 = High, 1 = Medium, 2 = Low) from their centres.
 # References:
 # - [https://scikit-learn.org/stable/modules/clustering.html#clustering-evaluation]
+# - [https://joblib.readthedocs.io/en/stable/parallel.html]
 
 #### Workspace setup ####
 import polars as pl
 import numpy as np
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed  # For fitting the candidate K values in parallel
 from sklearn.preprocessing import (
     StandardScaler,
 )  # Brings each variable to mean 0 / std 1 so no one feature dominates
@@ -26,17 +39,76 @@ from sklearn.metrics import (
     silhouette_score,
 )  # Measure optimal k via silhouette score (higher is better)
 
+from clustering import (
+    cluster_engine,
+    fit_model,
+    fit_minibatch_streaming,
+    fit_scaler_streaming,
+    iter_feature_chunks,
+    opportunity_order,
+    predict_streaming,
+    sample_rows,
+)  # shared clustering engine (batch or streaming mini-batch K-means)
+from pipeline_io import (
+    read_table,
+    scan_table,
+    sink_table,
+    write_table,
+    table_path,
+)  # shared table I/O (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+MERGED_TABLE = table_path("data/02-analysis_data/02-analysis_data_merged")
+CLUSTER_TABLE = table_path("data/02-analysis_data/03-cluster_neighbourhoods")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    MERGED_TABLE,
+]
+OUTPUTS = [
+    CLUSTER_TABLE,
+    MERGED_TABLE,  # rewritten with the cluster columns appended
+]
+
+#### Stage parameters (part of the build-cache fingerprint; see build_cache.py) ####
+PARAMS = {
+    "k_values": [2, 3, 4, 5, 6],  # candidate K values for the silhouette sweep
+    "n_clusters": 3,  # K used for the opportunity index (High / Medium / Low)
+    "random_state": 42,
+    "silhouette_sample_size": 10_000,  # rows scored per silhouette (None = always all rows)
+    "engine": cluster_engine(),  # "kmeans" or "minibatch" (CLUSTER_ENGINE)
+}
+
+# Number of parallel workers for the K sweep (-1 = all CPU cores)
+N_JOBS = -1
+
+
+#### Fit K-means for one K and score it (run in a joblib worker) ####
+# [https://scikit-learn.org/stable/modules/generated/sklearn.metrics.silhouette_score.html]
+# (the fit itself is cached on disk; see fit_model in clustering.py)
+def fit_and_score(X_scaled: np.ndarray, k: int) -> tuple[KMeans, float]:
+    kmeans, _ = fit_model("KMeans", k, PARAMS["random_state"], X_scaled)
+    sample_size = PARAMS["silhouette_sample_size"]
+    if sample_size is not None and len(X_scaled) <= sample_size:
+        sample_size = None  # small enough to score every row
+    score = silhouette_score(
+        X_scaled,
+        kmeans.labels_,
+        sample_size=sample_size,
+        random_state=PARAMS["random_state"],
+    )
+    return kmeans, score
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Generating neighbourhood K-means clusters based on Census profile data.")
 
     #### 05.0-eda_neighbourhood_clusters.py####
     #### Set random seed for reproducibility ####
     np.random.seed(838)
 
-    #### Load SES features ####
-    profiles = pl.read_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    #### SES features ####
     ses_columns = [
         "education_rate",  # proportion adults with a bachelor’s degree or higher
         "prop_single_parent",  # proportion of single-parent households
@@ -52,50 +124,113 @@ def main():
     crime_rate_columns = [
         f"{crime}_rate_{year}" for crime in crime_types for year in years
     ]
+    fill_rates = [pl.col(col).fill_null(0.0).alias(col) for col in crime_rate_columns]
 
-    # Combine the feature columns with the rate columns
-    profiles = profiles.with_columns(
-        [pl.col(col).fill_null(0.0).alias(col) for col in crime_rate_columns]
-    )
+    if PARAMS["engine"] == "minibatch":
+        # Stream the SES columns in chunks (the full feature matrix is never built)
+        def make_chunks():
+            return iter_feature_chunks(MERGED_TABLE, ses_columns, artifacts)
+
+        # Scale features incrementally, then fit every candidate K in the same passes over the data
+        scaler, n_rows = fit_scaler_streaming(make_chunks())
+        models = fit_minibatch_streaming(
+            make_chunks, scaler, n_rows, PARAMS["k_values"], PARAMS["random_state"]
+        )
+
+        # Silhouette scores on a random sample of rows
+        sample = sample_rows(
+            make_chunks(),
+            n_rows,
+            PARAMS["silhouette_sample_size"] or n_rows,
+            PARAMS["random_state"],
+        )
+        sample_scaled = scaler.transform(sample)
+        fits = {
+            k: (model, silhouette_score(sample_scaled, model.predict(sample_scaled)))
+            for k, model in models.items()
+        }
+    else:
+        #### Load SES features ####
+        # Combine the feature columns with the rate columns
+        profiles = read_table(MERGED_TABLE, artifacts).with_columns(fill_rates)
+
+        # Convert the selected SES columns to a float array
+        X = profiles.select(ses_columns).to_numpy().astype(float)
 
-    # Convert the selected SES columns to a float array
-    X = profiles.select(ses_columns).to_numpy().astype(float)
+        # Scale features so each has mean=0, std=1 (prevents any one feature dominating)
+        # [https://scikit-learn.org/stable/modules/generated/sklearn.preprocessing.StandardScaler.html]
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
 
-    # Scale features so each has mean=0, std=1 (prevents any one feature dominating)
-    # [https://scikit-learn.org/stable/modules/generated/sklearn.preprocessing.StandardScaler.html]
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+        # Fit every candidate K in parallel
+        fits = dict(
+            zip(
+                PARAMS["k_values"],
+                Parallel(n_jobs=N_JOBS)(
+                    delayed(fit_and_score)(X_scaled, k) for k in PARAMS["k_values"]
+                ),
+            )
+        )
 
     # Find the best K via silhouette score (higher is better: range [-1,1])
-    # [https://scikit-learn.org/stable/modules/generated/sklearn.metrics.silhouette_score.html]
     best_k, best_score = 3, -1
-    for k in range(2, 7):
-        labels = KMeans(n_clusters=k, random_state=42).fit_predict(X_scaled)
-        score = silhouette_score(X_scaled, labels)
+    for k, (_, score) in fits.items():
         print(f"K = {k} silhouette={score:.3f}")
         if score > best_score:
             best_k, best_score = k, score
     print(f"Best K = {best_k} (silhouette={best_score:.3f})\n")
 
     #### K-means Cluster Model ####
-    # Fit K-Means (K = 3), attach integer cluster labels
+    # K-Means (K = 3) fitted in the sweep above, attach integer cluster labels
     # [https://scikit-learn.org/stable/modules/generated/sklearn.cluster.KMeans.html#sklearn.cluster.KMeans.labels]
-    kmeans = KMeans(n_clusters=3, random_state=42).fit(X_scaled)
-    profiles = profiles.with_columns(
-        pl.Series("cluster", kmeans.labels_)  # cluster ∈ {0,1,2}
-    )
+    if PARAMS["n_clusters"] in fits:
+        kmeans = fits[PARAMS["n_clusters"]][0]
+    elif PARAMS["engine"] == "minibatch":
+        kmeans = fit_minibatch_streaming(
+            make_chunks, scaler, n_rows, [PARAMS["n_clusters"]], PARAMS["random_state"]
+        )[PARAMS["n_clusters"]]
+    else:
+        kmeans, _ = fit_model(
+            "KMeans", PARAMS["n_clusters"], PARAMS["random_state"], X_scaled
+        )
+    if PARAMS["engine"] == "minibatch":
+        labels = predict_streaming(kmeans, scaler, make_chunks())
+    else:
+        labels = kmeans.labels_
+
+    # Number the clusters by opportunity, from their centres (0 = highest)
+    labels = opportunity_order(kmeans.cluster_centers_, ses_columns)[labels]
 
     # Map clusters to SES labels
     # [https://scikit-learn.org/stable/modules/generated/sklearn.cluster.KMeans.html#sklearn.cluster.KMeans.labels_]
     label_map = {0: "High Opportunity", 1: "Medium Opportunity", 2: "Low Opportunity"}
 
-    profiles = profiles.with_columns(
-        pl.Series("cluster", kmeans.labels_),
-        pl.Series(
-            "opportunity_index",  # renamed qualitative category
-            [label_map[c] for c in kmeans.labels_],
-        ),
-    )
+    if PARAMS["engine"] == "minibatch":
+        # Only the labels are in memory: join them onto a lazy scan of the merged table by row position
+        # (the chunks were read in file order), so the table itself is streamed, never loaded whole
+        assignments = pl.DataFrame(
+            {
+                "row": np.arange(len(labels), dtype=np.uint32),
+                "cluster": labels,
+                "opportunity_index": [label_map[c] for c in labels],
+            }
+        )
+        profiles = (
+            scan_table(MERGED_TABLE, artifacts)
+            .with_columns(fill_rates)
+            .drop("cluster", "opportunity_index", strict=False)  # from an earlier run
+            .with_row_index("row")
+            .join(assignments.lazy(), on="row", how="left", maintain_order="left")
+            .drop("row")
+        )
+    else:
+        profiles = profiles.with_columns(
+            pl.Series("cluster", labels),  # cluster ∈ {0,1,2}
+            pl.Series(
+                "opportunity_index",  # renamed qualitative category
+                [label_map[c] for c in labels],
+            ),
+        ).lazy()
 
     # Summary stats for each cluster
     cluster_stats = (
@@ -110,29 +245,34 @@ def main():
             ]
         )
         .sort("cluster")
+        .collect(engine="streaming")
     )
     print("Cluster summaries:")
     print(cluster_stats)
 
-    # Show which neighbourhoods fell into each cluster
-    clustered = profiles.select(["neighbourhood", "cluster"]).sort(
-        ["cluster", "neighbourhood"]
-    )
-    print("\nNeighbourhood assignments:")
-    print(clustered)
+    # Show which neighbourhoods fell into each cluster (too many to list when streaming)
+    if PARAMS["engine"] != "minibatch":
+        clustered = (
+            profiles.select(["neighbourhood", "cluster"])
+            .sort(["cluster", "neighbourhood"])
+            .collect()
+        )
+        print("\nNeighbourhood assignments:")
+        print(clustered)
 
     #### Save cluster data ####
-    profiles.select(["neighbourhood", "cluster", "opportunity_index"]).write_csv(
-        "data/02-analysis_data/03-cluster_neighbourhoods.csv"
+    # (streamed to disk; written before the merged table is replaced, since it is read from it)
+    sink_table(
+        profiles.select(["neighbourhood", "cluster", "opportunity_index"]),
+        CLUSTER_TABLE,
+        artifacts,
     )
 
     # Append cluster info back to merged_data
-    profiles.write_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    sink_table(profiles, MERGED_TABLE, artifacts)
 
 
 #### ENTRY POINT ####
 if __name__ == "__main__":
     main()
-    print(
-        "Neighbourhood clusters generated and appended to data/02-analysis_data/02-analysis_data_merged.csv."
-    )
+    print(f"Neighbourhood clusters generated and appended to {MERGED_TABLE}.")
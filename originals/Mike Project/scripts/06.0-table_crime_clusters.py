@@ -3,14 +3,36 @@ import polars as pl
 import itertools  # for crime-year pairs
 from pathlib import Path
 
+from pipeline_io import (
+    read_table,
+    write_table,
+    table_path,
+)  # shared table I/O (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+MERGED_TABLE = table_path("data/02-analysis_data/02-analysis_data_merged")
+CLUSTER_RATES_TABLE = table_path("data/02-analysis_data/04-cluster_crime_rates")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    MERGED_TABLE,
+]
+OUTPUTS = [
+    CLUSTER_RATES_TABLE,
+    "data/03-table_data/assault_rate_change.csv",
+    "data/03-table_data/robbery_rate_change.csv",
+    "data/03-table_data/breakenter_rate_change.csv",
+    "data/03-table_data/shooting_rate_change.csv",
+]
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Generating crime trends by neighbourhood clusters (2019–2024).")
 
     #### 06.0-table_crime_clusters.py ####
     #### Load data ####
-    merged_data = pl.read_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    merged_data = read_table(MERGED_TABLE, artifacts)
 
     # Set parameters
     cluster_col = (
@@ -18,98 +40,113 @@ def main():
     )
     crime_types = ["assault", "robbery", "breakenter", "shooting"]  # crime categories
     years = list(range(2019, 2025))  # inclusive year range
-
-    # Collect yearly summaries for each crime type and cluster
-    summaries = []
-    for crime, year in itertools.product(crime_types, years):
-        col_name = f"{crime}_rate_{year}"
-        if col_name not in merged_data.columns:
-            continue  # skip if rate column is missing
-
-        avg_rate = (
-            merged_data.select([cluster_col, col_name])
-            .group_by(cluster_col)
-            .agg(pl.mean(col_name).alias("avg_rate"))
-            .with_columns([pl.lit(crime).alias("crime"), pl.lit(year).alias("year")])
+    rate_cols = [
+        f"{crime}_rate_{year}"
+        for crime, year in itertools.product(crime_types, years)
+        if f"{crime}_rate_{year}" in merged_data.columns  # skip missing rate columns
+    ]
+
+    #### Average rate per (crime, year, cluster) and year-to-year percent change ####
+    # One plan over every rate column: unpivot to long format, average by cluster, then compare each year with
+    # the previous one of the same crime and cluster (a window function)
+    # [https://docs.pola.rs/user-guide/expressions/window-functions/]
+    previous_rate = pl.col("avg_rate").shift(1).over("crime", cluster_col)
+    all_rates = (
+        merged_data.lazy()
+        .select(cluster_col, *rate_cols)
+        .unpivot(index=cluster_col, variable_name="column", value_name="rate")
+        .with_columns(
+            pl.col("column")
+            .str.split_exact("_rate_", 1)
+            .struct.rename_fields(["crime", "year"])
         )
-        summaries.append(avg_rate)
-
-    # Combine into long format DF
-    all_rates = pl.concat(summaries)
+        .unnest("column")
+        .with_columns(pl.col("year").cast(pl.Int32))
+        .group_by("crime", "year", cluster_col)
+        .agg(pl.mean("rate").alias("avg_rate"))
+        .sort("crime", cluster_col, "year")
+        .with_columns(
+            ((pl.col("avg_rate") - previous_rate) / previous_rate * 100)
+            .round(1)
+            .alias("pct_change")
+        )
+        .collect()
+    )
 
     #### Pivot wider: one row per (crime, year), columns = clusters ####
-    wide_df = all_rates.pivot(
-        index=["crime", "year"], on=cluster_col, values="avg_rate"
-    ).sort(["crime", "year"])
-
-    #### Compute year-to-year percent change for each consecutive year ####
-    cluster_cols = [c for c in wide_df.columns if c not in ["crime", "year"]]
-    pct_change_exprs = []
-    for col in cluster_cols:
-        for prev_year, curr_year in zip(years[:-1], years[1:]):
-            pct_name = f"{col}_pct_{prev_year}_{curr_year}"
-            expr = (
-                pl.when(pl.col("year") == curr_year)
-                .then(
-                    (
-                        (pl.col(col) - pl.col(col).shift(1).over("crime"))
-                        / pl.col(col).shift(1).over("crime")
-                        * 100
-                    ).round(1)
-                )
-                .alias(pct_name)
-            )
-            pct_change_exprs.append(expr)
-    wide_df = wide_df.with_columns(pct_change_exprs)
+    # Average rates go under the cluster name, and each change under "<cluster>_pct_<previous year>_<year>"
+    # (one pivot; clusters in name order, changes in year order)
+    pct_rates = all_rates.filter(pl.col("pct_change").is_not_null()).select(
+        "crime",
+        "year",
+        pl.format(
+            "{}_pct_{}_{}", cluster_col, pl.col("year") - 1, pl.col("year")
+        ).alias("column"),
+        pl.col("pct_change").alias("value"),
+    )
+    wide_df = (
+        pl.concat(
+            [
+                all_rates.select(
+                    "crime",
+                    "year",
+                    pl.col(cluster_col).alias("column"),
+                    pl.col("avg_rate").alias("value"),
+                ).sort("column"),
+                pct_rates.sort("column"),
+            ]
+        )
+        .pivot(index=["crime", "year"], on="column", values="value")
+        .sort(["crime", "year"])
+    )
 
     #### Save to CSV ####
     Path("data/02-analysis_data").mkdir(parents=True, exist_ok=True)
-    wide_df.write_csv("data/02-analysis_data/04-cluster_crime_rates.csv")
-
-    #### Separate Tables by Crime ####
-    cluster_labels = ["Low Opportunity", "Medium Opportunity", "High Opportunity"]
-    years = list(range(2019, 2025))
-    crime_types = ["assault", "robbery", "breakenter", "shooting"]
+    write_table(wide_df, CLUSTER_RATES_TABLE, artifacts)
 
     #### Separate Tables by Crime ####
-    cluster_labels = ["Low Opportunity", "Medium Opportunity", "High Opportunity"]
-    years = list(range(2019, 2025))
-    crime_types = ["assault", "robbery", "breakenter", "shooting"]
+    # Each cell is the rate, followed by its signed percent change after the first year, e.g., "657.2 (-13.3)"
+    cluster_labels = {
+        "Low Opportunity": "Low",
+        "Medium Opportunity": "Med",
+        "High Opportunity": "High",
+    }
+    sign = pl.when(pl.col("pct_change") >= 0).then(pl.lit("+")).otherwise(pl.lit(""))
+    rate_text = pl.col("avg_rate").round(1).cast(pl.String)
+    cells = all_rates.select(
+        "crime",
+        pl.col("year").alias("Year"),
+        pl.col(cluster_col).replace_strict(cluster_labels).alias("column"),
+        pl.when(pl.col("pct_change").is_null())
+        .then(rate_text)
+        .otherwise(
+            pl.format(
+                "{} ({}{})",
+                rate_text,
+                sign,
+                pl.col("pct_change").round(1).cast(pl.String),
+            )
+        )
+        .alias("cell"),
+    )
+    tables = (
+        cells.pivot(index=["crime", "Year"], on="column", values="cell")
+        .select("crime", "Year", *cluster_labels.values())
+        .sort("crime", "Year")
+        .partition_by("crime", as_dict=True, include_key=False)
+    )
 
+    Path("data/03-table_data").mkdir(parents=True, exist_ok=True)
     for crime in crime_types:
-        records = []
-        for y in years:
-            row = wide_df.filter((pl.col("crime") == crime) & (pl.col("year") == y))
-            if row.is_empty():
-                continue
-            data = row.to_dicts()[0]
-
-            rec = {"Year": y}
-            for label in cluster_labels:
-                rate = data[label]
-                if y == 2019:
-                    # 2019: just show the base rate
-                    rec[label] = f"{rate:.1f}"
-                else:
-                    pct = data[f"{label}_pct_{y-1}_{y}"]
-                    sign = "+" if pct >= 0 else ""
-                    rec[label] = f"{rate:.1f} ({sign}{pct:.1f})"
-            records.append(rec)
-
-        table = pl.DataFrame(records).rename(
-            {
-                "Low Opportunity": "Low",
-                "Medium Opportunity": "Med",
-                "High Opportunity": "High",
-            }
-        )
+        if (crime,) not in tables:
+            continue  # no rate columns for this crime
+        table = tables[(crime,)]
 
         # Display header and table
         print(f"### {crime.title()} Rate Change")
         print(table)
 
         # Save each crime to its own CSV
-        Path("data/03-table_data").mkdir(parents=True, exist_ok=True)
         table.write_csv(f"data/03-table_data/{crime}_rate_change.csv")
 
 
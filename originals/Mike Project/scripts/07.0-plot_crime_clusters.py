@@ -7,102 +7,146 @@
 # Pre-requisites:
 # - `polars` must be installed (pip install polars)
 # - `matplotlib` must be installed (pip install matplotlib)
+# Notes:
+# - The yearly trend of every crime is computed in one pass, and each figure is described as data (see
+#   figures.py): figures are rendered in parallel worker processes (headless Agg backend), and a figure whose
+#   data and style are unchanged since it was last saved is skipped.
 
 #### Workspace setup ####
 import polars as pl
-import matplotlib.pyplot as plt
 from pathlib import Path  # inherent to Python
 
+from figures import render_figures  # parallel, hash-skipping figure rendering
+from pipeline_io import (
+    read_table,
+    table_path,
+)  # shared table reader (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+MERGED_TABLE = table_path("data/02-analysis_data/02-analysis_data_merged")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    MERGED_TABLE,
+]
+OUTPUTS = [
+    "other/figures/1_assault.png",
+    "other/figures/2_breakenter.png",
+    "other/figures/3_robbery.png",
+    "other/figures/4_shooting.png",
+    "other/figures/fig_1_crime_trends.png",
+]
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Plotting crime trends by neighbourhood clusters (2019–2024).")
 
     #### 07.0-plot_crime_clusters.py ####
     #### Load data ####
-    merged_data = pl.read_csv("data/02-analysis_data/02-analysis_data_merged.csv")
+    merged_data = read_table(MERGED_TABLE, artifacts)
     crime_types = ["assault", "breakenter", "robbery", "shooting"]
     years = [2019, 2020, 2021, 2022, 2023, 2024]
+    levels = ["Low Opportunity", "Medium Opportunity", "High Opportunity"]
 
     # Specify figures directory
     png_directory = Path("other/figures")
     png_directory.mkdir(parents=True, exist_ok=True)
 
-    # 2x2 subplot figure for combined trends plot
-    # [https://matplotlib.org/stable/gallery/subplots_axes_and_figures/subplot_demo.html]
-    fig_combined, axes = plt.subplots(2, 2, figsize=(12, 8))
-    axes = axes.flatten()
-
-    # Loop through each crime and save plots
-    for idx, crime in enumerate(crime_types):
-        # Build rate column names for each year
-        rate_columns = [f"{crime}_rate_{y}" for y in years]
-
-        # Unpivot wide to long for time-series, extract year as integer (like pivot_longer)
-        # Before: Columns = years, Rows = neighborhoods
-        # After: Rows = neighborhood-year combinations, Columns = [SES, year, rate]
-        # [https://docs.pola.rs/api/python/stable/reference/dataframe/api/polars.DataFrame.unpivot.html#polars.DataFrame.unpivot]
-        merged_long = (
-            merged_data.select(
-                ["opportunity_index", *rate_columns]
-            )  # * = "and all individual columns from list"
-            .unpivot(
-                on=rate_columns,
-                index="opportunity_index",
-                variable_name="year",
-                value_name="rate",
-            )
-            .with_columns(pl.col("year").str.extract(r"_(\d{4})$", 1).cast(pl.Int64))
+    # Build rate column names for each crime and year
+    rate_columns = [f"{crime}_rate_{y}" for crime in crime_types for y in years]
+
+    # Unpivot wide to long for time-series, extract crime and year (like pivot_longer)
+    # Before: Columns = crime-years, Rows = neighborhoods
+    # After: Rows = neighborhood-crime-year combinations, Columns = [SES, crime, year, rate]
+    # [https://docs.pola.rs/api/python/stable/reference/dataframe/api/polars.DataFrame.unpivot.html#polars.DataFrame.unpivot]
+    merged_long = (
+        merged_data.select(
+            ["opportunity_index", *rate_columns]
+        )  # * = "and all individual columns from list"
+        .unpivot(
+            on=rate_columns,
+            index="opportunity_index",
+            variable_name="column",
+            value_name="rate",
+        )
+        .with_columns(
+            pl.col("column").str.extract(r"^(.+)_rate_\d{4}$", 1).alias("crime"),
+            pl.col("column").str.extract(r"_(\d{4})$", 1).cast(pl.Int64).alias("year"),
         )
+    )
+
+    # Group by crime, SES and year, calculating mean rates (once for every crime)
+    trend = (
+        merged_long.group_by(["crime", "opportunity_index", "year"])
+        .agg(pl.col("rate").mean().alias("average_rate"))
+        .sort(["crime", "opportunity_index", "year"])
+    )
 
-        # Group by SES and year, calculating mean rates
-        trend = (
-            merged_long.group_by(["opportunity_index", "year"])
-            .agg(pl.col("rate").mean().alias("average_rate"))
-            .sort(["opportunity_index", "year"])
+    # One line per SES cluster, for each crime: {crime: [{"label", "x", "y"}, ...]}
+    lines = {crime: [] for crime in crime_types}
+    for (crime, lvl), sub in trend.group_by(
+        ["crime", "opportunity_index"], maintain_order=True
+    ):
+        lines[crime].append(
+            {
+                "label": lvl,
+                "x": sub["year"].to_list(),
+                "y": sub["average_rate"].to_list(),
+            }
         )
+    for crime in crime_types:
+        lines[crime].sort(key=lambda series: levels.index(series["label"]))
 
-        # Plot each SES cluster individually
-        fig_indiv, ax_indiv = plt.subplots(figsize=(6, 4))
-        for lvl in ["Low Opportunity", "Medium Opportunity", "High Opportunity"]:
-            sub = trend.filter(pl.col("opportunity_index") == lvl)
-            ax_indiv.plot(
-                sub["year"].to_list(),
-                sub["average_rate"].to_list(),
-                marker="o",
-                label=lvl,
-            )
-        # Enhance plot readability
-        ax_indiv.set_title(f"{crime.title()} Rate Trends (2019–2024)")
-        ax_indiv.set_xlabel("Year")
-        ax_indiv.set_ylabel(f"Average {crime.title()} Rate per 100K Persons")
-        ax_indiv.legend(title="Opportunity Level")
-        fig_indiv.tight_layout()
-        fig_indiv.savefig(png_directory / f"{idx+1}_{crime}.png", dpi=300)
-        plt.close(fig_indiv)
-
-        # Add crime type to its position in 2x2 grid
-        ax_combined = axes[idx]
-        for lvl in ["Low Opportunity", "Medium Opportunity", "High Opportunity"]:
-            sub = trend.filter(pl.col("opportunity_index") == lvl)
-            ax_combined.plot(
-                sub["year"].to_list(),
-                sub["average_rate"].to_list(),
-                marker="o",
-                label=lvl,
-            )
-        ax_combined.set_title(f"{crime.title()} Rate")
-        ax_combined.set_xlabel("Year")
-        ax_combined.set_ylabel("Rate per 100K")
-        ax_combined.legend(title="SES Cluster", fontsize=8)
+    #### Describe figures ####
+    # One figure per crime, then every crime in a 2-column grid
+    # [https://matplotlib.org/stable/gallery/subplots_axes_and_figures/subplot_demo.html]
+    specs = [
+        {
+            "path": str(png_directory / f"{idx+1}_{crime}.png"),
+            "figsize": [6, 4],
+            "grid": [1, 1],
+            "dpi": 300,
+            "panels": [
+                {
+                    "title": f"{crime.title()} Rate Trends (2019–2024)",
+                    "xlabel": "Year",
+                    "ylabel": f"Average {crime.title()} Rate per 100K Persons",
+                    "legend_title": "Opportunity Level",
+                    "legend_fontsize": None,
+                    "series": lines[crime],
+                }
+            ],
+        }
+        for idx, crime in enumerate(crime_types)
+    ]
+    grid_rows = (len(crime_types) + 1) // 2
+    specs.append(
+        {
+            "path": str(png_directory / "fig_1_crime_trends.png"),
+            "figsize": [12, 4 * grid_rows],
+            "grid": [grid_rows, 2],
+            "dpi": 300,
+            "suptitle": "Crime Rate Trends by Opportunity Cluster (2019–2024)",
+            "suptitle_size": 16,
+            "layout_rect": [0, 0.03, 1, 0.95],
+            "panels": [
+                {
+                    "title": f"{crime.title()} Rate",
+                    "xlabel": "Year",
+                    "ylabel": "Rate per 100K",
+                    "legend_title": "SES Cluster",
+                    "legend_fontsize": 8,
+                    "series": lines[crime],
+                }
+                for crime in crime_types
+            ],
+        }
+    )
 
     #### Save figures ####
-    fig_combined.suptitle(
-        "Crime Rate Trends by Opportunity Cluster (2019–2024)", fontsize=16
-    )
-    fig_combined.tight_layout(rect=[0, 0.03, 1, 0.95])
-    fig_combined.savefig(png_directory / "fig_1_crime_trends.png", dpi=300)
-    plt.close(fig_combined)
+    for path in render_figures(specs):
+        print(f"Saved: {path}")
 
 
 #### ENTRY POINT ####
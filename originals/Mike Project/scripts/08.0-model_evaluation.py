@@ -9,39 +9,182 @@
 # - `numpy` must be installed (pip install numpy)
 # - `matplotlib` must be installed (pip install matplotlib)
 # - `scikit-learn` must be installed (pip install scikit-learn)
+# - `joblib` must be installed (installed with scikit-learn)
+# Notes:
+# - With CLUSTER_ENGINE=minibatch (see clustering.py), the scaler and K-means models are fitted on the streamed
+#   merged table with partial_fit, and the PCA plot, GMM fits and metrics use a random sample of
+#   PARAMS["sample_size"] rows (GaussianMixture has no partial_fit, and the metrics are O(n²)).
+# - Batch fits go through the disk cache in clustering.py (fit_model), so each configuration is trained once
+#   per data version and shared by the PCA plot and the metrics below.
+# - Set BOOTSTRAP_RESAMPLES (or "--bootstrap N" in 00.0-run_pipeline.py) to also evaluate cluster stability:
+#   every configuration is refitted on that many bootstrap resamples (each with its own seed), spread over all
+#   CPU cores, and the mean and percentile confidence interval of each metric, plus the adjusted Rand index
+#   against the labels of the single fit above, are saved to STABILITY_TABLE.
 # References:
 # - [https://scikit-learn.org/stable/auto_examples/cluster/plot_kmeans_assumptions.html]
+# - [https://scikit-learn.org/stable/modules/clustering.html#rand-index]
 
 #### Workspace setup ####
+import os  # inherent to Python
 import polars as pl
 import numpy as np
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed, effective_n_jobs  # For the bootstrap refits
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sklearn.mixture import GaussianMixture
 from sklearn.metrics import (
     silhouette_score,
     davies_bouldin_score,
     calinski_harabasz_score,
 )
 
+from clustering import (
+    bootstrap_metrics,
+    cluster_engine,
+    fit_model,
+    fit_minibatch_streaming,
+    fit_scaler_streaming,
+    iter_feature_chunks,
+    sample_rows,
+)  # shared clustering engine (batch or streaming mini-batch K-means)
+from pipeline_io import (
+    read_table,
+    write_table,
+    table_path,
+)  # shared table I/O (CSV/Parquet/IPC or in-memory)
+
+#### Analysis tables (file extension follows PIPELINE_FORMAT; see pipeline_io.py) ####
+MERGED_TABLE = table_path("data/02-analysis_data/02-analysis_data_merged")
+EVALUATION_TABLE = table_path("data/02-analysis_data/05-cluster_evaluation_metrics")
+STABILITY_TABLE = table_path("data/02-analysis_data/06-cluster_stability")
+
+#### Stage inputs / outputs (read by 00.0-run_pipeline.py to order stages) ####
+INPUTS = [
+    MERGED_TABLE,
+]
+OUTPUTS = [
+    "other/figures/fig_2_cluster_comparisons.png",
+    "other/figures/fig_3_cluster_metrics.png",
+    EVALUATION_TABLE,
+]
+
+#### Stage parameters (part of the build-cache fingerprint; see build_cache.py) ####
+PARAMS = {
+    "engine": cluster_engine(),  # "kmeans" or "minibatch" (CLUSTER_ENGINE)
+    "sample_size": 10_000,  # rows evaluated with the minibatch engine
+    "random_state": 42,
+    "bootstrap_resamples": int(
+        os.environ.get("BOOTSTRAP_RESAMPLES", "0")
+    ),  # 0 = no stability evaluation
+    "confidence": 0.95,  # width of the bootstrap percentile intervals
+    "bootstrap_silhouette_size": 2_000,  # rows scored per resample silhouette (O(n²))
+}
+if PARAMS["bootstrap_resamples"]:
+    OUTPUTS.append(STABILITY_TABLE)
+
+# Number of parallel workers for the bootstrap refits (-1 = all CPU cores)
+N_JOBS = -1
+
+
+#### Bootstrap every configuration and save the mean / CI of each metric ####
+# `fit_labels` gives the reference labels of a configuration (the single fit evaluated above).
+def evaluate_stability(scaled_matrix: np.ndarray, fit_labels, artifacts=None):
+    n_resamples = PARAMS["bootstrap_resamples"]
+    print(f"Bootstrapping cluster stability ({n_resamples} resamples per model).")
+    seeds = np.random.SeedSequence(PARAMS["random_state"]).generate_state(n_resamples)
+    silhouette_size = PARAMS["bootstrap_silhouette_size"]
+    if len(scaled_matrix) <= silhouette_size:
+        silhouette_size = None  # small enough to score every row
+
+    # One task per (configuration, batch of seeds), so every core stays busy across configurations
+    configs = [(model_type, k) for model_type in ["KMeans", "GMM"] for k in [2, 3]]
+    batches = np.array_split(seeds, min(effective_n_jobs(N_JOBS), n_resamples))
+    tasks = [(config, batch) for config in configs for batch in batches]
+    results = Parallel(n_jobs=N_JOBS)(
+        delayed(bootstrap_metrics)(
+            model_type,
+            k,
+            scaled_matrix,
+            fit_labels(model_type, k),
+            batch,
+            silhouette_size,
+        )
+        for (model_type, k), batch in tasks
+    )
+
+    # Mean and percentile interval of each metric, one row per configuration and metric
+    tail = 50 * (1 - PARAMS["confidence"])
+    metric_names = [
+        "Silhouette",
+        "Davies-Bouldin",
+        "Calinski-Harabasz",
+        "Adjusted Rand",
+    ]
+    stability_rows = []
+    for model_type, k in configs:
+        scores = np.vstack(
+            [r for (config, _), r in zip(tasks, results) if config == (model_type, k)]
+        )
+        low, high = np.nanpercentile(scores, [tail, 100 - tail], axis=0)
+        for i, metric in enumerate(metric_names):
+            stability_rows.append(
+                {
+                    "Clustering Algorithm": model_type,
+                    "Clusters ($k$)": k,
+                    "Metric": metric,
+                    "Mean": np.nanmean(scores[:, i]),
+                    "CI Low": low[i],
+                    "CI High": high[i],
+                }
+            )
+    stability_table = pl.DataFrame(stability_rows).with_columns(
+        pl.col("Mean", "CI Low", "CI High").round(3)
+    )
+
+    # Preview
+    with pl.Config(tbl_rows=len(stability_rows)):
+        print(stability_table)
+    write_table(stability_table, STABILITY_TABLE, artifacts)
+
 
 #### MAIN FUNCTION ####
-def main():
+def main(artifacts=None):
     print("Evaluating K-means vs. Gaussian Mixture clustering models ($K$ = 2, 3).")
 
     #### 08.0-model_evaluation.py ####
     # Load and scale SES features (equal weighting requirement for clustering)
-    data = pl.read_csv("data/02-analysis_data/02-analysis_data_merged.csv")
     ses_columns = [
         "education_rate",
         "prop_single_parent",
         "unemployment_rate",
         "median_income",
     ]
-    feature_matrix = data.select(ses_columns).to_numpy()
-    scaled_matrix = StandardScaler().fit_transform(feature_matrix)
+    if PARAMS["engine"] == "minibatch":
+        # Stream the SES columns: fit the scaler and K-means models incrementally, evaluate on a sample
+        def make_chunks():
+            return iter_feature_chunks(MERGED_TABLE, ses_columns, artifacts)
+
+        scaler, n_rows = fit_scaler_streaming(make_chunks())
+        kmeans_models = fit_minibatch_streaming(
+            make_chunks, scaler, n_rows, [2, 3], PARAMS["random_state"]
+        )
+        scaled_matrix = scaler.transform(
+            sample_rows(
+                make_chunks(), n_rows, PARAMS["sample_size"], PARAMS["random_state"]
+            )
+        )
+    else:
+        data = read_table(MERGED_TABLE, artifacts)
+        feature_matrix = data.select(ses_columns).to_numpy()
+        scaled_matrix = StandardScaler().fit_transform(feature_matrix)
+
+    # Cluster labels of one configuration (K-means: hard assignments; GMM: probabilistic assignments)
+    def fit_labels(model_type: str, num_clusters: int) -> np.ndarray:
+        if model_type == "KMeans" and PARAMS["engine"] == "minibatch":
+            return kmeans_models[num_clusters].predict(scaled_matrix)
+        options = {"n_init": 10} if model_type == "KMeans" else {}
+        _, labels = fit_model(model_type, num_clusters, 42, scaled_matrix, **options)
+        return labels
 
     # PCA for 2D visualization (preserves variance)
     # [https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.PCA.html]
@@ -49,9 +192,9 @@ def main():
 
     # Define clustering configurations (K-means vs. GMM; K =2, 3) and colour maps
     cluster_configs = [
-        ("$K$-means", 2, "Paired", "$K$-means ($K$ = 2)"),
+        ("KMeans", 2, "Paired", "$K$-means ($K$ = 2)"),
         ("GMM", 2, "Accent", "GMM ($K$ = 2)"),
-        ("$K$-means", 3, "Set1", "$K$-means ($K$ = 3)"),
+        ("KMeans", 3, "Set1", "$K$-means ($K$ = 3)"),
         ("GMM", 3, "Set2", "GMM ($K$ = 3)"),
     ]
 
@@ -61,13 +204,7 @@ def main():
 
     for idx, (model_type, num_clusters, colormap, title) in enumerate(cluster_configs):
         #### Train models (LLM assistance) ####
-        # K-means: Hard assignments; GMM: Probabilistic assignments
-        if model_type == "KMeans":
-            model = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
-        else:
-            model = GaussianMixture(n_components=num_clusters, random_state=42)
-
-        cluster_labels = model.fit_predict(scaled_matrix)  # cluster assignments
+        cluster_labels = fit_labels(model_type, num_clusters)  # cluster assignments
         # Plot PCA results with cluster labels
         # [https://matplotlib.org/stable/api/_as_gen/matplotlib.pyplot.scatter.html]
         scatter = axes_pca[idx].scatter(
@@ -111,11 +248,7 @@ def main():
     evaluation_results = []
     for model_type in ["KMeans", "GMM"]:
         for num_clusters in [2, 3]:
-            if model_type == "KMeans":
-                model = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
-            else:
-                model = GaussianMixture(n_components=num_clusters, random_state=42)
-            labels = model.fit_predict(scaled_matrix)
+            labels = fit_labels(model_type, num_clusters)
 
             # Silhouette: Cluster separation/cohesion (-1 to 1, higher = better)
             # Davies-Bouldin: Cluster overlap (lower = better)
@@ -195,12 +328,14 @@ def main():
     print(eval_table)
 
     #### Save CSV ####
-    eval_table.write_csv("data/02-analysis_data/05-cluster_evaluation_metrics.csv")
+    write_table(eval_table, EVALUATION_TABLE, artifacts)
+
+    #### Bootstrap Cluster Stability (BOOTSTRAP_RESAMPLES > 0) ####
+    if PARAMS["bootstrap_resamples"]:
+        evaluate_stability(scaled_matrix, fit_labels, artifacts)
 
 
 #### ENTRY POINT ####
 if __name__ == "__main__":
     main()
-    print(
-        "Model evaluation saved to data/02-analysis_data/05-cluster_evaluation_metrics.csv."
-    )
+    print(f"Model evaluation saved to {EVALUATION_TABLE}.")
@@ -0,0 +1,119 @@
+#### Preamble ####
+# Purpose: Content-hash build cache used by 00.0-run_pipeline.py to skip stages whose outputs are still up to date.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - Standard library only (`hashlib`, `json`).
+# - Stages declare `INPUTS`, `OUTPUTS` and (optionally) a `PARAMS` dictionary at module level.
+# Notes:
+# - A stage's fingerprint = hash of (its script source, shared helper modules, PARAMS, input signatures).
+# - An input's signature is the hash recorded by the stage that last wrote it (so 05.0 rewriting the merged
+#   file in place does not invalidate 04.0); files no stage writes (e.g., raw data) are hashed on disk.
+# - A stage is skipped when its fingerprint is unchanged and its outputs are still on disk (with the recorded
+#   content, for files it is the final writer of), similar to a make/Snakemake rule.
+# References:
+# - [https://docs.python.org/3/library/hashlib.html#file-hashing]
+# - [https://snakemake.readthedocs.io/en/stable/snakefiles/rules.html]
+
+#### Workspace setup ####
+import hashlib  # inherent to Python
+import json  # inherent to Python
+import os  # inherent to Python
+from pathlib import Path  # inherent to Python
+
+# Build state lives under .cache/ (ignored by git)
+STATE_FILE = Path(".cache/pipeline/build_state.json")
+
+
+#### Hash a file in 1 MB chunks (no need to hold large raw dumps in memory) ####
+# [https://docs.python.org/3/library/hashlib.html#hashlib.file_digest]
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class BuildCache:
+    def __init__(self, script_directory: Path, state_file: Path = STATE_FILE):
+        self.script_directory = script_directory
+        self.state_file = state_file
+        self.state = {"stages": {}, "file_hashes": {}}
+        if state_file.exists():
+            self.state = json.loads(state_file.read_text())
+
+        # Shared helper modules (e.g., this file) have no numeric prefix; editing one rebuilds every stage
+        helpers = sorted(
+            p for p in script_directory.glob("*.py") if not p.name[0].isdigit()
+        )
+        self.helpers_hash = hashlib.sha256(
+            b"".join(hash_file(p).encode() for p in helpers)
+        ).hexdigest()
+
+    #### Hash a file on disk, reusing the previous hash if its size and mtime are unchanged ####
+    def file_hash(self, path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns]
+        cached = self.state["file_hashes"].get(path)
+        if cached and cached["stat"] == key:
+            return cached["sha256"]
+        digest = hash_file(Path(path))
+        self.state["file_hashes"][path] = {"stat": key, "sha256": digest}
+        return digest
+
+    #### Compute a stage's fingerprint from its source, parameters and inputs ####
+    # `producers` maps each input path to the upstream stage that writes it (if any).
+    def fingerprint(self, stage: str, module, producers: dict[str, str]) -> str:
+        input_signatures = {}
+        for path in getattr(module, "INPUTS", []):
+            producer = producers.get(path)
+            if producer is not None:
+                record = self.state["stages"].get(producer, {})
+                input_signatures[path] = record.get("outputs", {}).get(path)
+            else:
+                input_signatures[path] = self.file_hash(path)
+
+        payload = {
+            "script": hash_file(self.script_directory / f"{stage}.py"),
+            "helpers": self.helpers_hash,
+            "params": getattr(module, "PARAMS", {}),
+            "inputs": input_signatures,
+        }
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    #### Decide whether a stage can be skipped ####
+    # `final_outputs` = outputs that no later stage overwrites (their content must still match).
+    def is_up_to_date(
+        self, stage: str, fingerprint: str, outputs: list[str], final_outputs: set[str]
+    ) -> bool:
+        record = self.state["stages"].get(stage)
+        if record is None or record["fingerprint"] != fingerprint:
+            return False
+        for path in outputs:
+            if not os.path.exists(path):
+                return False
+            if path in final_outputs and self.file_hash(path) != record["outputs"].get(
+                path
+            ):
+                return False
+        return True
+
+    #### Record a successful run (called right after the stage finishes) ####
+    def record(self, stage: str, fingerprint: str, outputs: list[str]):
+        self.state["stages"][stage] = {
+            "fingerprint": fingerprint,
+            "outputs": {path: self.file_hash(path) for path in outputs},
+        }
+        self.save()
+
+    #### Write the state atomically (write to a temp file, then rename) ####
+    # [https://docs.python.org/3/library/os.html#os.replace]
+    def save(self):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.state_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(self.state, indent=2, sort_keys=True))
+        os.replace(temp_file, self.state_file)
@@ -0,0 +1,162 @@
+#### Preamble ####
+# Purpose: Serves the checked-in raw data through a local, CKAN-compatible API so the pipeline can run offline.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - Standard library only (`http.server`).
+# - Run with "python scripts/ckan_fixture_server.py [--port 8000] [--data-dir data/01-raw_data]" from the project root,
+#   then point the download script at it: "CKAN_BASE_URL=http://127.0.0.1:8000 python scripts/02.0-download_data.py".
+# Notes:
+# - Implements only what 02.0-download_data.py uses: `/api/3/action/package_show?id=...`, `/datastore/dump/<id>`
+#   and plain file URLs (for the XLSX resource), with ETag / Last-Modified validators and 304 responses.
+# - Use --data-dir to serve a snapshot copy (the download script writes into data/01-raw_data).
+# References:
+# - [https://docs.python.org/3/library/http.server.html]
+# - [https://docs.ckan.org/en/latest/api/#ckan.logic.action.get.package_show]
+
+#### Workspace setup ####
+import argparse  # inherent to Python
+import hashlib  # inherent to Python
+import json  # inherent to Python
+import shutil  # inherent to Python
+from datetime import datetime, timezone  # inherent to Python
+from email.utils import formatdate  # inherent to Python
+from functools import partial  # inherent to Python
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)  # inherent to Python
+from pathlib import Path  # inherent to Python
+from urllib.parse import parse_qs, urlparse  # inherent to Python
+
+#### Packages and resources served (file names are relative to --data-dir) ####
+FIXTURES = {
+    "neighbourhood-crime-rates": [
+        {
+            "id": "neighbourhood-crime-rates-data",
+            "name": "neighbourhood-crime-rates",
+            "format": "CSV",
+            "datastore_active": True,
+            "file": "neighbourhood_crime.csv",
+        },
+    ],
+    "neighbourhood-profiles": [
+        {
+            "id": "neighbourhood-profiles-2021",
+            "name": "neighbourhood-profiles-2021-158-model",
+            "format": "XLSX",
+            "datastore_active": False,
+            "file": "neighbourhood_profiles.xlsx",
+        },
+    ],
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, data_dir: Path, **kwargs):
+        self.data_dir = data_dir
+        super().__init__(*args, **kwargs)
+
+    #### Route GET requests ####
+    def do_GET(self):
+        url = urlparse(self.path)
+        resources = {r["id"]: r for rs in FIXTURES.values() for r in rs}
+        if url.path == "/api/3/action/package_show":
+            package_id = parse_qs(url.query).get("id", [""])[0]
+            self.send_package(package_id)
+        elif url.path.startswith("/datastore/dump/"):
+            resource = resources.get(url.path.removeprefix("/datastore/dump/"))
+            self.send_resource_file(resource)
+        elif url.path.startswith("/files/"):
+            resource = resources.get(url.path.removeprefix("/files/"))
+            self.send_resource_file(resource)
+        else:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+
+    #### package_show: the package's resources, with last_modified taken from the file ####
+    def send_package(self, package_id: str):
+        if package_id not in FIXTURES:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+            return
+        base_url = f"http://{self.headers['Host']}"
+        resources = []
+        for resource in FIXTURES[package_id]:
+            path = self.data_dir / resource["file"]
+            modified = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+            resources.append(
+                {
+                    "id": resource["id"],
+                    "name": resource["name"],
+                    "format": resource["format"],
+                    "datastore_active": resource["datastore_active"],
+                    "last_modified": modified.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                    "url": f"{base_url}/files/{resource['id']}",
+                }
+            )
+        self.send_json(
+            {"success": True, "result": {"name": package_id, "resources": resources}}
+        )
+
+    #### Resource body (streamed from disk), honouring If-None-Match ####
+    def send_resource_file(self, resource: dict | None):
+        if resource is None:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+            return
+        path = self.data_dir / resource["file"]
+        stat = path.stat()
+        etag = (
+            '"'
+            + hashlib.sha256(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()[
+                :16
+            ]
+            + '"'
+        )
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            "text/csv" if path.suffix == ".csv" else "application/octet-stream",
+        )
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+#### Create the server (port 0 = any free port; see server.server_port) ####
+def make_server(data_dir: Path, port: int = 8000) -> ThreadingHTTPServer:
+    handler = partial(FixtureHandler, data_dir=Path(data_dir))
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+#### MAIN FUNCTION ####
+def main():
+    parser = argparse.ArgumentParser(description="Offline CKAN stand-in server.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-dir", type=Path, default=Path("data/01-raw_data"))
+    args = parser.parse_args()
+
+    server = make_server(args.data_dir, args.port)
+    print(f"Serving {args.data_dir} as CKAN on http://127.0.0.1:{server.server_port}")
+    server.serve_forever()
+
+
+#### ENTRY POINT ####
+if __name__ == "__main__":
+    main()
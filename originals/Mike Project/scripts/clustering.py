@@ -0,0 +1,226 @@
+#### Preamble ####
+# Purpose: Clustering engine shared by 05.0 and 08.0: batch K-means (default) or streaming mini-batch K-means.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `numpy`, `polars`, `pyarrow` and `scikit-learn` must be installed
+# Notes:
+# - The engine is picked by the CLUSTER_ENGINE environment variable (or "--engine" in 00.0-run_pipeline.py):
+#   "kmeans" (default; what the paper uses) loads the whole SES feature matrix and fits batch KMeans;
+#   "minibatch" never builds the full matrix: features are streamed from the merged table in chunks of
+#   CHUNK_ROWS rows, StandardScaler and MiniBatchKMeans are fitted with partial_fit, and labels are predicted
+#   chunk by chunk (for geographies too large to cluster comfortably in memory, e.g., census blocks).
+# - partial_fit initialises MiniBatchKMeans once, from the first chunk it sees (its n_init is ignored). So the
+#   starting centres come from a batch KMeans fit (N_INIT restarts) on a random sample of up to
+#   INIT_SAMPLE_ROWS rows, and the streamed passes refine them.
+# - Cluster numbers are ordered by opportunity (0 = highest), so labels mean the same thing whichever engine
+#   (or random initialisation) produced them.
+# - fit_model() caches batch fits on disk (.cache/pipeline/fits/, via joblib.Memory), keyed on the algorithm,
+#   K, seed, any other estimator options and a hash of the feature matrix: each model is trained once per data
+#   version, whichever script (05.0 or 08.0) asks for it first. Delete the folder to clear it.
+# - bootstrap_metrics() refits a configuration on bootstrap resamples of the rows (one seed each) for the
+#   cluster-stability evaluation in 08.0 (BOOTSTRAP_RESAMPLES > 0). These fits are not cached.
+# References:
+# - [https://scikit-learn.org/stable/modules/clustering.html#mini-batch-k-means]
+# - [https://scikit-learn.org/stable/computing/scaling_strategies.html#incremental-learning]
+# - [https://arrow.apache.org/docs/python/dataset.html]
+# - [https://joblib.readthedocs.io/en/stable/memory.html]
+
+#### Workspace setup ####
+import os  # inherent to Python
+from collections.abc import Callable, Iterator  # inherent to Python
+
+import numpy as np
+import polars as pl
+import pyarrow.dataset as ds
+from joblib import Memory
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import (
+    adjusted_rand_score,
+    calinski_harabasz_score,
+    davies_bouldin_score,
+    silhouette_score,
+)
+from sklearn.mixture import GaussianMixture
+from sklearn.preprocessing import StandardScaler
+
+# Clustering engines (see above)
+ENGINES = ["kmeans", "minibatch"]
+
+# Rows per streamed chunk (also the mini-batch size)
+CHUNK_ROWS = 10_000
+
+# Passes over the data when fitting MiniBatchKMeans
+EPOCHS = 3
+
+# Starting centres of MiniBatchKMeans: KMeans restarts on a sample of this many rows (see above)
+INIT_SAMPLE_ROWS = 100_000
+N_INIT = 3
+
+# Direction of each SES feature in the opportunity ordering (higher education / income = more opportunity)
+OPPORTUNITY_SIGNS = {
+    "education_rate": 1,
+    "prop_single_parent": -1,
+    "unemployment_rate": -1,
+    "median_income": 1,
+}
+
+# pyarrow dataset format for each table extension (see pipeline_io.FORMAT_EXTENSIONS)
+DATASET_FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "ipc"}
+
+# Fitted models live under .cache/ (ignored by git)
+FIT_CACHE = Memory(".cache/pipeline/fits", verbose=0)
+
+
+#### Engine named by CLUSTER_ENGINE ####
+def cluster_engine() -> str:
+    engine = os.environ.get("CLUSTER_ENGINE", "kmeans").lower()
+    if engine not in ENGINES:
+        raise ValueError(f"CLUSTER_ENGINE must be one of {ENGINES}, got {engine!r}")
+    return engine
+
+
+#### Unfitted batch clustering model ####
+# `algorithm` is "KMeans" or "GMM"; `options` are passed on to the estimator (e.g., n_init=10).
+def make_model(
+    algorithm: str, k: int, random_state: int, **options
+) -> KMeans | GaussianMixture:
+    if algorithm == "KMeans":
+        return KMeans(n_clusters=k, random_state=random_state, **options)
+    if algorithm == "GMM":
+        return GaussianMixture(n_components=k, random_state=random_state, **options)
+    raise ValueError(f"Unknown clustering algorithm: {algorithm!r}")
+
+
+#### Fit a batch clustering model, or load it if this exact fit was done before ####
+# Returns the fitted model and its labels for X.
+@FIT_CACHE.cache
+def fit_model(
+    algorithm: str, k: int, random_state: int, X: np.ndarray, **options
+) -> tuple[KMeans | GaussianMixture, np.ndarray]:
+    model = make_model(algorithm, k, random_state, **options)
+    labels = model.fit_predict(X)
+    return model, labels
+
+
+#### Refit one configuration on bootstrap resamples (run in a joblib worker) ####
+# Each seed draws len(X) rows with replacement and fits the model with that seed (one initialisation, so the
+# spread covers both the data and the starting centres). Returns one row per seed: silhouette, Davies-Bouldin
+# and Calinski-Harabasz on the resample (NaN if it collapsed into one cluster), then the adjusted Rand index
+# of the refitted model's labels for every row of X against `reference`.
+# Silhouette is O(n²), so it is scored on `silhouette_size` rows of the resample when given.
+def bootstrap_metrics(
+    algorithm: str,
+    k: int,
+    X: np.ndarray,
+    reference: np.ndarray,
+    seeds: np.ndarray,
+    silhouette_size: int | None = None,
+) -> np.ndarray:
+    scores = np.full((len(seeds), 4), np.nan)
+    for row, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        resample = X[rng.integers(0, len(X), size=len(X))]
+        model = make_model(algorithm, k, int(seed), n_init=1).fit(resample)
+        labels = model.predict(resample)
+        if len(np.unique(labels)) > 1:
+            scores[row, 0] = silhouette_score(
+                resample, labels, sample_size=silhouette_size, random_state=int(seed)
+            )
+            scores[row, 1] = davies_bouldin_score(resample, labels)
+            scores[row, 2] = calinski_harabasz_score(resample, labels)
+        scores[row, 3] = adjusted_rand_score(reference, model.predict(X))
+    return scores
+
+
+#### Stream feature columns of a table as float arrays of up to CHUNK_ROWS rows ####
+# Reads from the artifact store when an earlier stage left the table in memory (see pipeline_io.py).
+def iter_feature_chunks(
+    path: str, columns: list[str], artifacts=None
+) -> Iterator[np.ndarray]:
+    if artifacts is not None and path in artifacts.tables:
+        for chunk in artifacts.tables[path].select(columns).iter_slices(CHUNK_ROWS):
+            yield chunk.to_numpy().astype(float)
+        return
+    dataset = ds.dataset(path, format=DATASET_FORMATS[os.path.splitext(path)[1]])
+    for batch in dataset.to_batches(columns=columns, batch_size=CHUNK_ROWS):
+        if batch.num_rows:
+            yield pl.from_arrow(batch).to_numpy().astype(float)
+
+
+#### Fit a StandardScaler incrementally; also returns the number of rows ####
+def fit_scaler_streaming(chunks: Iterator[np.ndarray]) -> tuple[StandardScaler, int]:
+    scaler = StandardScaler()
+    n_rows = 0
+    for chunk in chunks:
+        scaler.partial_fit(chunk)
+        n_rows += len(chunk)
+    return scaler, n_rows
+
+
+#### Fit one MiniBatchKMeans per K, all from the same streamed passes over the data ####
+# `make_chunks` returns a fresh chunk iterator (called once per epoch, plus once to sample the starting
+# centres); `n_rows` is the number of rows it yields.
+def fit_minibatch_streaming(
+    make_chunks: Callable[[], Iterator[np.ndarray]],
+    scaler: StandardScaler,
+    n_rows: int,
+    k_values: list[int],
+    random_state: int,
+) -> dict[int, MiniBatchKMeans]:
+    sample = scaler.transform(
+        sample_rows(make_chunks(), n_rows, INIT_SAMPLE_ROWS, random_state)
+    )
+    models = {
+        k: MiniBatchKMeans(
+            n_clusters=k,
+            init=KMeans(n_clusters=k, random_state=random_state, n_init=N_INIT)
+            .fit(sample)
+            .cluster_centers_,
+            n_init=1,
+            random_state=random_state,
+        )
+        for k in k_values
+    }
+    for _ in range(EPOCHS):
+        for chunk in make_chunks():
+            scaled = scaler.transform(chunk)
+            for k, model in models.items():
+                if len(scaled) >= k:  # partial_fit needs at least k rows
+                    model.partial_fit(scaled)
+    return models
+
+
+#### Predict labels chunk by chunk ####
+def predict_streaming(
+    model, scaler: StandardScaler, chunks: Iterator[np.ndarray]
+) -> np.ndarray:
+    return np.concatenate([model.predict(scaler.transform(c)) for c in chunks])
+
+
+#### Uniform random sample of rows from the stream (row order kept) ####
+def sample_rows(
+    chunks: Iterator[np.ndarray], n_rows: int, size: int, random_state: int
+) -> np.ndarray:
+    rng = np.random.default_rng(random_state)
+    keep = np.sort(rng.choice(n_rows, size=min(size, n_rows), replace=False))
+    sampled = []
+    offset = 0
+    for chunk in chunks:
+        in_chunk = keep[(keep >= offset) & (keep < offset + len(chunk))] - offset
+        sampled.append(chunk[in_chunk])
+        offset += len(chunk)
+    return np.concatenate(sampled)
+
+
+#### Renumber clusters by opportunity (0 = highest) ####
+# `centers` are the cluster centres in scaled feature space, in the order of `columns`.
+# Returns an array mapping each original label to its new number (use as new_labels = order[labels]).
+def opportunity_order(centers: np.ndarray, columns: list[str]) -> np.ndarray:
+    signs = np.array([OPPORTUNITY_SIGNS[c] for c in columns])
+    ranking = np.argsort(-(centers @ signs), kind="stable")
+    order = np.empty(len(ranking), dtype=int)
+    order[ranking] = np.arange(len(ranking))
+    return order
@@ -0,0 +1,106 @@
+#### Preamble ####
+# Purpose: Renders line-chart figures described as plain data, in parallel, skipping any whose content is unchanged.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `matplotlib` must be installed (pip install matplotlib)
+# Notes:
+# - A figure "spec" is a dictionary holding everything drawn (data, titles, labels, sizes, dpi), so the same
+#   spec always gives the same picture. Its hash (with this file's rendering code and the matplotlib version)
+#   is saved next to the build state in .cache/pipeline/figures/; a figure whose PNG exists and whose hash is
+#   unchanged is not rendered again.
+# - Figures are rendered in a process pool (one figure per task) with matplotlib's non-interactive Agg backend
+#   forced, so no display is needed and workers never open windows.
+# References:
+# - [https://matplotlib.org/stable/users/explain/figure/backends.html]
+# - [https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor]
+
+#### Workspace setup ####
+import hashlib  # inherent to Python
+import inspect  # inherent to Python
+import json  # inherent to Python
+import os  # inherent to Python
+from concurrent.futures import ProcessPoolExecutor  # inherent to Python
+from pathlib import Path  # inherent to Python
+
+import matplotlib
+
+matplotlib.use("Agg")  # headless: must come before pyplot is imported
+import matplotlib.pyplot as plt
+
+# Hash of each rendered figure (ignored by git, like the build state)
+HASH_DIRECTORY = Path(".cache/pipeline/figures")
+
+
+#### Draw one figure from its spec and save it ####
+# Spec keys: path, figsize, grid ([rows, columns]), dpi, panels, and optionally suptitle, suptitle_size and
+# layout_rect (passed to tight_layout). Each panel has title, xlabel, ylabel, legend_title, legend_fontsize
+# (None = default) and series: a list of {"label", "x", "y"} lines drawn with circle markers.
+def render_figure(spec: dict) -> str:
+    matplotlib.use("Agg")  # in case the worker imported pyplot some other way
+    fig, axes = plt.subplots(*spec["grid"], figsize=spec["figsize"], squeeze=False)
+    axes = axes.flatten()
+    for ax, panel in zip(axes, spec["panels"]):
+        for series in panel["series"]:
+            ax.plot(series["x"], series["y"], marker="o", label=series["label"])
+        ax.set_title(panel["title"])
+        ax.set_xlabel(panel["xlabel"])
+        ax.set_ylabel(panel["ylabel"])
+        ax.legend(title=panel["legend_title"], fontsize=panel["legend_fontsize"])
+    for ax in axes[len(spec["panels"]) :]:
+        ax.set_visible(False)  # unused grid cells
+    if spec.get("suptitle"):
+        fig.suptitle(spec["suptitle"], fontsize=spec.get("suptitle_size"))
+    if spec.get("layout_rect"):
+        fig.tight_layout(rect=spec["layout_rect"])
+    else:
+        fig.tight_layout()
+    fig.savefig(spec["path"], dpi=spec["dpi"])
+    plt.close(fig)
+    return spec["path"]
+
+
+#### Hash of a spec (plus the rendering code and matplotlib version) ####
+def figure_hash(spec: dict) -> str:
+    payload = json.dumps(
+        [spec, inspect.getsource(render_figure), matplotlib.__version__],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+#### Render every figure whose spec changed since it was last saved ####
+# `jobs` = maximum number of worker processes (default: number of CPU cores).
+# Returns the paths that were rendered.
+def render_figures(specs: list[dict], jobs: int | None = None) -> list[str]:
+    HASH_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    hashes = {spec["path"]: figure_hash(spec) for spec in specs}
+
+    def hash_file(path: str) -> Path:
+        return HASH_DIRECTORY / (path.replace("/", "__") + ".sha256")
+
+    stale = [
+        spec
+        for spec in specs
+        if not os.path.exists(spec["path"])
+        or not hash_file(spec["path"]).exists()
+        or hash_file(spec["path"]).read_text() != hashes[spec["path"]]
+    ]
+    for spec in specs:
+        if spec not in stale:
+            print(f"Unchanged: {spec['path']}")
+
+    # Render in parallel (a pool is not worth starting for a single figure)
+    workers = min(jobs or os.cpu_count() or 1, len(stale))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_figure, stale))
+    else:
+        rendered = [render_figure(spec) for spec in stale]
+
+    # Record the hashes only once the PNGs are saved
+    for path in rendered:
+        hash_file(path).write_text(hashes[path])
+    return rendered
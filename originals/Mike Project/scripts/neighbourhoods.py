@@ -0,0 +1,197 @@
+#### Preamble ####
+# Purpose: Canonical neighbourhood names and the persistent neighbourhood ID index used to join the crime and profile data.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `polars` must be installed (pip install polars)
+# - Rebuild the index with "python scripts/neighbourhoods.py" from the project root after downloading new raw data.
+# Notes:
+# - data/04-reference_data/neighbourhood_index.csv maps every known (canonical) spelling of a neighbourhood to its
+#   City of Toronto neighbourhood number (HOOD_ID in the crime data), so 03.0 / 03.1 tag each row with an integer
+#   `neighbourhood_id` and 04.0 joins on it instead of on strings.
+# - Spelling differences between the two sources are caught when the index is built (not silently at join time):
+#   a profile spelling that matches no crime spelling stops the build, and can be added to the index by hand
+#   as another row with the right ID. Existing rows are never renumbered.
+# - match_names() resolves spellings that are not in the index by fuzzy matching: names are split into character
+#   trigrams, and only pairs that share a trigram are ever compared (a join on the trigram acts as an inverted
+#   index), so thousands of area names do not mean millions of comparisons. 04.0 keeps the results in
+#   data/04-reference_data/neighbourhood_matches.csv for review.
+# References:
+# - [https://docs.pola.rs/api/python/stable/reference/expressions/string.html]
+# - [https://docs.pola.rs/user-guide/transformations/joins/]
+# - [https://en.wikipedia.org/wiki/Sørensen–Dice_coefficient]
+
+#### Workspace setup ####
+import os  # inherent to Python
+import sys  # inherent to Python
+
+import polars as pl
+
+from pipeline_io import scan_excel_cached  # cached reader for the profile workbook
+
+# Lookup table: canonical spelling -> neighbourhood ID
+NEIGHBOURHOOD_INDEX = "data/04-reference_data/neighbourhood_index.csv"
+INDEX_SCHEMA = {"spelling": pl.String, "neighbourhood_id": pl.Int32}
+
+# Fuzzy matches of spellings missing from the index (written by 04.0; edit `accepted` to review them)
+NEIGHBOURHOOD_MATCHES = "data/04-reference_data/neighbourhood_matches.csv"
+MATCHES_SCHEMA = {
+    "spelling": pl.String,
+    "matched_spelling": pl.String,
+    "neighbourhood_id": pl.Int32,
+    "score": pl.Float64,
+    "accepted": pl.Boolean,
+}
+
+# Matches scoring at least this much (Dice similarity of trigram sets, 0 to 1) are accepted automatically
+MIN_MATCH_SCORE = 0.8
+
+
+#### Canonical form of a neighbourhood name (vectorised; works on any string expression) ####
+# e.g., "Cabbagetown-South St. James Town" and "Cabbagetown-South St.James Town" -> "cabbagetown-south-stjames-town"
+def canonical_name(name: pl.Expr) -> pl.Expr:
+    return (
+        name.str.normalize(form="NFKC")
+        .str.strip_chars(" ")  # strip leading/trailing spaces
+        .str.replace_all(r"[`‘’]", "'")  # standardize apostrophes
+        .str.replace_all(r"\.\s*", "")  # drop every period (and the space after "St. ")
+        .str.replace_all(r"\s+", "-")  # spaces become dashes
+        .str.to_lowercase()  # lowercase
+    )
+
+
+#### Canonicalise a name column and add its `neighbourhood_id` (null if the spelling is not in the index) ####
+# Accepts a DataFrame or a LazyFrame (and returns the same kind).
+def with_neighbourhood_id(df, column: str = "neighbourhood"):
+    index = pl.scan_csv(NEIGHBOURHOOD_INDEX, schema=INDEX_SCHEMA)
+    if isinstance(df, pl.DataFrame):
+        index = index.collect()
+    return df.with_columns(canonical_name(pl.col(column))).join(
+        index, left_on=column, right_on="spelling", how="left"
+    )
+
+
+#### Character trigrams of each name (one row per distinct name and trigram) ####
+# Names are padded with a space, so first and last letters count as much as the middle ones.
+def trigrams(names: pl.DataFrame, column: str) -> pl.DataFrame:
+    padded = " " + pl.col(column) + " "
+    return (
+        names.select(pl.col(column), padded.alias("padded"))
+        .with_columns(
+            pl.int_ranges(0, pl.col("padded").str.len_chars() - 2).alias("position")
+        )
+        .explode("position")
+        .select(
+            pl.col(column),
+            pl.col("padded").str.slice(pl.col("position"), 3).alias("trigram"),
+        )
+        .unique()
+    )
+
+
+#### Best fuzzy match for each name among the candidates ####
+# `candidates` has `spelling` and `neighbourhood_id` columns. Returns one row per name that shares at least one
+# trigram with a candidate: spelling, matched_spelling, neighbourhood_id and score (Dice similarity).
+def match_names(names: list[str], candidates: pl.DataFrame) -> pl.DataFrame:
+    name_grams = trigrams(pl.DataFrame({"spelling": names}).unique(), "spelling")
+    candidate_grams = trigrams(
+        candidates.select(pl.col("spelling").alias("matched_spelling")).unique(),
+        "matched_spelling",
+    )
+    sizes = name_grams.group_by("spelling").len("n_name")
+    candidate_sizes = candidate_grams.group_by("matched_spelling").len("n_candidate")
+
+    # Blocking: only (name, candidate) pairs with a trigram in common are generated
+    return (
+        name_grams.join(candidate_grams, on="trigram")
+        .group_by("spelling", "matched_spelling")
+        .len("shared")
+        .join(sizes, on="spelling")
+        .join(candidate_sizes, on="matched_spelling")
+        .with_columns(
+            (2 * pl.col("shared") / (pl.col("n_name") + pl.col("n_candidate"))).alias(
+                "score"
+            )
+        )
+        .sort("score", "matched_spelling", descending=[True, False])
+        .group_by("spelling", maintain_order=True)
+        .first()
+        .join(
+            candidates.select(
+                pl.col("spelling").alias("matched_spelling"), "neighbourhood_id"
+            ).unique("matched_spelling"),
+            on="matched_spelling",
+        )
+        .select("spelling", "matched_spelling", "neighbourhood_id", "score")
+        .sort("spelling")
+    )
+
+
+#### Build (or extend) the index from the raw crime and profile data ####
+# Crime spellings come with their HOOD_ID; every profile spelling must then already be in the index.
+def build_index(
+    crime_path: str = "data/01-raw_data/neighbourhood_crime.csv",
+    profile_path: str = "data/01-raw_data/neighbourhood_profiles.xlsx",
+) -> pl.DataFrame:
+    if os.path.exists(NEIGHBOURHOOD_INDEX):
+        index = pl.read_csv(NEIGHBOURHOOD_INDEX, schema=INDEX_SCHEMA)
+    else:
+        index = pl.DataFrame(schema=INDEX_SCHEMA)
+
+    # Crime data: one row per neighbourhood, with the City's neighbourhood number
+    crime = (
+        pl.scan_csv(crime_path)
+        .select(
+            canonical_name(pl.col("AREA_NAME")).alias("spelling"),
+            pl.col("HOOD_ID").cast(pl.Int32).alias("neighbourhood_id"),
+        )
+        .collect()
+    )
+    conflicts = crime.join(index, on="spelling").filter(
+        pl.col("neighbourhood_id") != pl.col("neighbourhood_id_right")
+    )
+    if conflicts.height:
+        raise ValueError(
+            f"Neighbourhood IDs changed for: {conflicts['spelling'].to_list()}"
+        )
+    index = pl.concat([index, crime.join(index, on="spelling", how="anti")])
+
+    # Profile data: one column per neighbourhood (the first column holds the row labels)
+    profile_names = scan_excel_cached(profile_path).collect_schema().names()[1:]
+    profile = pl.DataFrame({"name": profile_names}).select(
+        canonical_name(pl.col("name")).alias("spelling")
+    )
+    unmatched = profile.join(index, on="spelling", how="anti")
+    if unmatched.height:
+        raise ValueError(
+            f"Profile neighbourhoods missing from {NEIGHBOURHOOD_INDEX} "
+            f"(add a row with the matching neighbourhood_id): {unmatched['spelling'].to_list()}"
+        )
+
+    return index.sort("neighbourhood_id", "spelling")
+
+
+#### MAIN FUNCTION ####
+def main():
+    print("Building the neighbourhood ID index.")
+    index = build_index()
+
+    # Write to a temporary file, then rename it over the index
+    # [https://docs.python.org/3/library/os.html#os.replace]
+    os.makedirs(os.path.dirname(NEIGHBOURHOOD_INDEX), exist_ok=True)
+    temp_path = NEIGHBOURHOOD_INDEX + ".tmp"
+    index.write_csv(temp_path)
+    os.replace(temp_path, NEIGHBOURHOOD_INDEX)
+    print(
+        f"{index.height} spellings of {index['neighbourhood_id'].n_unique()} neighbourhoods saved to: {NEIGHBOURHOOD_INDEX}"
+    )
+
+
+#### ENTRY POINT ####
+if __name__ == "__main__":
+    try:
+        main()
+    except ValueError as error:
+        sys.exit(str(error))
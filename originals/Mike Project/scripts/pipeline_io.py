@@ -0,0 +1,142 @@
+#### Preamble ####
+# Purpose: Shared table reader/writer for the pipeline stages, with an optional in-memory artifact store.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `polars` must be installed (pip install polars)
+# Notes:
+# - Tables under data/02-analysis_data/ are stored in the format named by the PIPELINE_FORMAT environment
+#   variable: "csv" (default; what the paper reads), "parquet" (zstd-compressed) or "ipc" (Arrow IPC / Feather v2).
+#   Parquet and IPC keep the exact dtypes and float values, so nothing is re-inferred on read.
+# - Run on their own, stages read and write files exactly as before (artifacts=None).
+# - When 00.0-run_pipeline.py is run with --in-memory, it passes one ArtifactStore to every stage's main():
+#   tables written by one stage are handed to the next as Polars DataFrames (no re-parsing), and are only
+#   written to disk if they are in `persist`.
+# - scan_table() / sink_table() read and write a table as a lazy query, so a stage can stream a table larger
+#   than memory (e.g., 05.0 with CLUSTER_ENGINE=minibatch).
+# - scan_excel_cached() parses a workbook once and keeps a Parquet copy under .cache/pipeline/converted/,
+#   named after a hash of the workbook's content and the read options; later runs scan the copy (a new
+#   download, or other read options, gets a new copy).
+# References:
+# - [https://docs.pola.rs/user-guide/io/parquet/]
+# - [https://docs.pola.rs/api/python/stable/reference/api/polars.read_ipc.html]
+# - [https://docs.pola.rs/user-guide/lazy/optimizations/]
+
+#### Workspace setup ####
+import hashlib  # inherent to Python
+import os  # inherent to Python
+from pathlib import Path  # inherent to Python
+
+import polars as pl
+
+# File extension for each storage format
+FORMAT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "ipc": ".arrow"}
+
+# Parquet copies of slow-to-parse source files live under .cache/ (ignored by git)
+CONVERSION_CACHE = Path(".cache/pipeline/converted")
+
+
+#### Path of an analysis table in the configured storage format ####
+# e.g., table_path("data/02-analysis_data/02-analysis_data_merged") -> ".../02-analysis_data_merged.parquet"
+def table_path(stem: str) -> str:
+    storage_format = os.environ.get("PIPELINE_FORMAT", "csv").lower()
+    if storage_format not in FORMAT_EXTENSIONS:
+        raise ValueError(
+            f"PIPELINE_FORMAT must be one of {sorted(FORMAT_EXTENSIONS)}, got {storage_format!r}"
+        )
+    return stem + FORMAT_EXTENSIONS[storage_format]
+
+
+#### In-memory store of DataFrames keyed by their file path ####
+class ArtifactStore:
+    def __init__(self, persist=()):
+        self.tables = {}  # path -> pl.DataFrame
+        self.persist = set(persist)  # paths that are still written to disk
+
+
+#### Read a table (from the artifact store if an earlier stage left it there) ####
+# The reader is picked from the file extension, so it always matches the writer.
+def read_table(path: str, artifacts: ArtifactStore | None = None) -> pl.DataFrame:
+    if artifacts is not None and path in artifacts.tables:
+        return artifacts.tables[path]
+    if path.endswith(".parquet"):
+        return pl.read_parquet(path)
+    if path.endswith(".arrow"):
+        return pl.read_ipc(path, memory_map=True)
+    return pl.read_csv(path)
+
+
+#### Scan a table lazily (the artifact store's DataFrame, or the file) ####
+def scan_table(path: str, artifacts: ArtifactStore | None = None) -> pl.LazyFrame:
+    if artifacts is not None and path in artifacts.tables:
+        return artifacts.tables[path].lazy()
+    if path.endswith(".parquet"):
+        return pl.scan_parquet(path)
+    if path.endswith(".arrow"):
+        return pl.scan_ipc(path, memory_map=True)
+    return pl.scan_csv(path)
+
+
+#### Write a table (to the artifact store and/or disk) ####
+def write_table(
+    df: pl.DataFrame, path: str, artifacts: ArtifactStore | None = None
+) -> None:
+    if artifacts is not None:
+        artifacts.tables[path] = df
+        if path not in artifacts.persist:
+            return  # stays in memory only
+    # Write to a temporary file, then rename it over the target: 05.0 rewrites the merged table it just read,
+    # and an in-place write would truncate a memory-mapped IPC file that is still being read
+    # [https://docs.python.org/3/library/os.html#os.replace]
+    temp_path = path + ".tmp"
+    if path.endswith(".parquet"):
+        df.write_parquet(temp_path, compression="zstd")
+    elif path.endswith(".arrow"):
+        # Uncompressed, so reads can be memory-mapped
+        df.write_ipc(temp_path, compression="uncompressed")
+    else:
+        df.write_csv(temp_path)
+    os.replace(temp_path, path)
+
+
+#### Scan a spreadsheet through a cached Parquet copy (parsed from Excel only once per workbook version) ####
+# The copy is keyed on the SHA-256 of the workbook and of its read options (e.g., sheet_name), so a re-downloaded
+# workbook with new content, or a call with other options, is converted again (and the stale copy removed). Returns a LazyFrame, so callers' filters/selects only read what they need.
+# [https://docs.python.org/3/library/hashlib.html#hashlib.file_digest]
+def scan_excel_cached(path: str, **read_options) -> pl.LazyFrame:
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256")
+    digest.update(repr(sorted(read_options.items())).encode())
+    digest = digest.hexdigest()[:16]
+    stem = Path(path).stem
+    cached = CONVERSION_CACHE / f"{stem}-{digest}.parquet"
+    if not cached.exists():
+        CONVERSION_CACHE.mkdir(parents=True, exist_ok=True)
+        for stale in CONVERSION_CACHE.glob(f"{stem}-{'?' * 16}.parquet"):
+            stale.unlink()
+        temp_path = cached.with_suffix(".tmp")
+        pl.read_excel(path, **read_options).write_parquet(temp_path)
+        os.replace(temp_path, cached)
+    return pl.scan_parquet(cached)
+
+
+#### Write a lazy query's result without collecting it (streamed to disk in batches) ####
+# Same formats and temporary-file rename as write_table; in the artifact store the result is collected,
+# since in-memory mode keeps every table in memory anyway.
+# [https://docs.pola.rs/user-guide/concepts/streaming/]
+def sink_table(
+    lf: pl.LazyFrame, path: str, artifacts: ArtifactStore | None = None
+) -> None:
+    if artifacts is not None:
+        write_table(lf.collect(), path, artifacts)
+        return
+    temp_path = path + ".tmp"
+    if path.endswith(".parquet"):
+        lf.sink_parquet(temp_path, compression="zstd")
+    elif path.endswith(".arrow"):
+        lf.sink_ipc(temp_path, compression="uncompressed")
+    else:
+        lf.sink_csv(temp_path)
+    os.replace(temp_path, path)
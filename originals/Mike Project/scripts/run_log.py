@@ -0,0 +1,194 @@
+#### Preamble ####
+# Purpose: Per-stage instrumentation for 00.0-run_pipeline.py: timing, memory, row counts, JSON-lines run log.
+# Author: Mike Cowan
+# Date: 19 May 2025
+# Contact: m.cowan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites:
+# - `polars` must be installed (pip install polars)
+# Notes:
+# - measure_stage() wraps one stage's main() and returns a record: status, wall and CPU time, peak memory, and
+#   the rows and bytes of every declared input (before the stage) and output (after it, if it succeeded).
+# - CPU time = user + system time of the stage's process plus any child processes it waited for (worker pools
+#   that outlive the stage, e.g., joblib's, are not included).
+# - Peak RSS is the process's high-water mark. Each stage runs in a fresh worker process, so it is the stage's
+#   own peak; with --in-memory all stages share one process, so it can only grow from stage to stage.
+#   tracemalloc (--trace-memory) adds the peak of Python-tracked allocations (NumPy included, Polars' native
+#   buffers not), at some cost in speed.
+# - Every record is appended as one JSON line to RUN_LOG (tagged with the run ID), so runs can be compared
+#   over time; print_summary() prints the run's table.
+# References:
+# - [https://docs.python.org/3/library/resource.html#resource.getrusage]
+# - [https://docs.python.org/3/library/tracemalloc.html]
+# - [https://jsonlines.org/]
+
+#### Workspace setup ####
+import json  # inherent to Python
+import os  # inherent to Python
+import sys  # inherent to Python
+import time  # inherent to Python
+import traceback  # inherent to Python
+import tracemalloc  # inherent to Python
+from datetime import datetime, timezone  # inherent to Python
+from pathlib import Path  # inherent to Python
+
+import polars as pl
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+# One JSON record per stage per run (ignored by git, like the build state)
+RUN_LOG = Path(".cache/pipeline/run_log.jsonl")
+
+# Row counts of tables on disk (other files, e.g., figures, only report their size)
+TABLE_SCANNERS = {
+    ".csv": pl.scan_csv,
+    ".parquet": pl.scan_parquet,
+    ".arrow": pl.scan_ipc,
+}
+
+
+#### Run ID: start time of the run (UTC) ####
+def new_run_id() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+#### CPU seconds used so far by this process and its reaped children ####
+def cpu_seconds() -> float:
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+#### Peak resident set size of this process (MB) ####
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+#### Rows and bytes of each file (or in-memory table) ####
+def artifact_stats(paths: list[str], artifacts=None) -> list[dict]:
+    stats = []
+    for path in paths:
+        if artifacts is not None and path in artifacts.tables:
+            table = artifacts.tables[path]
+            stats.append(
+                {
+                    "path": path,
+                    "rows": table.height,
+                    "bytes": table.estimated_size(),
+                    "in_memory": True,
+                }
+            )
+            continue
+        if not os.path.exists(path):
+            stats.append({"path": path, "rows": None, "bytes": None})
+            continue
+        rows = None
+        scanner = TABLE_SCANNERS.get(os.path.splitext(path)[1])
+        if scanner is not None:
+            try:
+                rows = scanner(path).select(pl.len()).collect().item()
+            except Exception:
+                pass  # not readable as a table; report the size only
+        stats.append({"path": path, "rows": rows, "bytes": os.path.getsize(path)})
+    return stats
+
+
+#### Run `call` (a stage's main) and measure it ####
+# Exceptions are caught and recorded (status "failed", with the traceback), so the caller always gets a record.
+def measure_stage(
+    stage: str, module, call, artifacts=None, trace_memory: bool = False
+) -> dict:
+    record = {
+        "stage": stage,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "inputs": artifact_stats(getattr(module, "INPUTS", []), artifacts),
+    }
+    if trace_memory:
+        tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+    try:
+        call()
+        record["status"] = "ok"
+        record["error"] = None
+    except Exception:
+        record["status"] = "failed"
+        record["error"] = traceback.format_exc()
+    record["wall_s"] = round(time.perf_counter() - wall_start, 3)
+    record["cpu_s"] = round(cpu_seconds() - cpu_start, 3)
+    record["peak_rss_mb"] = peak_rss_mb()
+    if trace_memory:
+        record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    # A failed stage's outputs may be stale files from an earlier run
+    if record["status"] == "ok":
+        record["outputs"] = artifact_stats(getattr(module, "OUTPUTS", []), artifacts)
+    return record
+
+
+#### Append a run's records to the JSON-lines log ####
+def write_run_log(records: list[dict], run_id: str, path: Path = RUN_LOG) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as log:
+        for record in records:
+            log.write(json.dumps({"run_id": run_id, **record}) + "\n")
+
+
+#### Print one line per stage: status, time, memory, rows and size ####
+def print_summary(records: list[dict]) -> None:
+    def total(stats: list[dict], key: str):
+        values = [s[key] for s in stats if s.get(key) is not None]
+        return sum(values) if values else None
+
+    def show(value, digits: int = 1) -> str:
+        if value is None:
+            return "-"
+        return f"{value:,.{digits}f}" if isinstance(value, float) else f"{value:,}"
+
+    header = [
+        "Stage",
+        "Status",
+        "Wall s",
+        "CPU s",
+        "Peak MB",
+        "Rows in",
+        "Rows out",
+        "MB out",
+    ]
+    rows = [
+        [
+            r["stage"],
+            r["status"],
+            show(r.get("wall_s"), 2),
+            show(r.get("cpu_s"), 2),
+            show(r.get("peak_rss_mb")),
+            show(total(r.get("inputs", []), "rows")),
+            show(total(r.get("outputs", []), "rows")),
+            show(
+                (
+                    total(r.get("outputs", []), "bytes") / 1024**2
+                    if total(r.get("outputs", []), "bytes") is not None
+                    else None
+                ),
+                2,
+            ),
+        ]
+        for r in records
+    ]
+    widths = [max(len(line[i]) for line in [header, *rows]) for i in range(len(header))]
+    print("\nStage summary:")
+    for line in [header, *rows]:
+        print(
+            "  ".join(
+                cell.ljust(width) if i < 2 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(line, widths))
+            )
+        )
@@ -8,14 +8,17 @@
 # Any other information needed? None
 
 #### Workspace setup ####
+import os
 import pandas as pd
 import requests
 from pathlib import Path
 
 #### Download data ####
 # Define the Open Data Toronto API endpoint for the package
+# (set CKAN_BASE_URL to use another CKAN instance)
+base_url = os.environ.get("CKAN_BASE_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca").rstrip("/")
 package_id = "b68cb71b-44a7-4394-97e2-5d2f41462a5d"
-package_url = f"https://ckan0.cf.opendata.inter.prod-toronto.ca/api/3/action/package_show?id={package_id}"
+package_url = f"{base_url}/api/3/action/package_show?id={package_id}"
 
 # Get package metadata
 response = requests.get(package_url)
@@ -0,0 +1,95 @@
+#### Preamble ####
+# Purpose: Serves the saved streetcar delay data through a local, CKAN-compatible API so the download can run offline
+# Author: Aakash Vaithyanathan
+# Date: September 24, 2024
+# Contact: aakash.vaithyanathan@mail.utoronto.ca
+# License: MIT
+# Pre-requisites: pandas, openpyxl
+# Any other information needed?
+#   Run "python scripts/ckan_fixture_server.py [--port 8000] [--data-dir data/raw_data]" from the project folder,
+#   then "CKAN_BASE_URL=http://127.0.0.1:8000 python scripts/01-download_data.py" in another terminal.
+#   Serves only what 01-download_data.py uses: package_show and the 2023 XLSX resource. The workbook is
+#   ttc-streetcar-delay-data-2023.xlsx in the data folder, or, if there is none, is built (in memory) from the
+#   saved download, unedited_ttc_streetcar_delay_2023.csv. That file was saved by the R version of the download,
+#   which writes missing values as "NA"; they become empty cells, so the Python download writes them as empty.
+#   https://docs.python.org/3/library/http.server.html
+
+#### Workspace setup ####
+import argparse
+import hashlib
+import io
+import json
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+PACKAGE_ID = "b68cb71b-44a7-4394-97e2-5d2f41462a5d"
+RESOURCE_ID = "ttc-streetcar-delay-data-2023"
+
+parser = argparse.ArgumentParser(description="Offline CKAN stand-in server.")
+parser.add_argument("--port", type=int, default=8000)
+parser.add_argument("--data-dir", type=Path, default=Path("data/raw_data"))
+args = parser.parse_args()
+
+#### Resource: the 2023 workbook ####
+workbook_path = args.data_dir / (RESOURCE_ID + ".xlsx")
+if workbook_path.exists():
+    source = workbook_path
+    workbook = workbook_path.read_bytes()
+else:
+    source = args.data_dir / "unedited_ttc_streetcar_delay_2023.csv"
+    buffer = io.BytesIO()
+    pd.read_csv(source, dtype=str).to_excel(buffer, index=False, engine="openpyxl")
+    workbook = buffer.getvalue()
+etag = '"' + hashlib.sha256(workbook).hexdigest()[:16] + '"'
+modified = datetime.fromtimestamp(source.stat().st_mtime, timezone.utc)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/3/action/package_show" and parse_qs(url.query).get("id") == [PACKAGE_ID]:
+            resource = {
+                "id": RESOURCE_ID,
+                "name": RESOURCE_ID,
+                "format": "XLSX",
+                "datastore_active": False,
+                "last_modified": modified.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                "url": f"http://{self.headers['Host']}/files/{RESOURCE_ID}",
+            }
+            self.send_json({"success": True, "result": {"id": PACKAGE_ID, "resources": [resource]}})
+        elif url.path == "/files/" + RESOURCE_ID:
+            self.send_workbook()
+        else:
+            self.send_json({"success": False, "error": "Not found"}, status=404)
+
+    # Sends the workbook, with an ETag so conditional requests get "304 Not Modified"
+    def send_workbook(self):
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        self.send_header("Content-Length", str(len(workbook)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(workbook)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+#### Serve ####
+server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+print(f"Serving {source} as CKAN on http://127.0.0.1:{server.server_port}")
+server.serve_forever()